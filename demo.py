@@ -1,28 +1,116 @@
 from __future__ import absolute_import, print_function, division
-import pylab as pl
 from imtiler import *
 from imtiler.util import *
 
-class FiniteMasker:
+maskfunc = DefaultMasker()
+
+TILEINFO_FILE = 'tileinfo.txt'
+SHARD_TILEINFO = 'tileinfo.shard%03d.txt'
+SHARD_MANIFEST = 'manifest.shard%03d.txt'
+SHARD_STATS = 'tilestats.shard%03d.npz'
+STATS_FILE = 'tilestats.npz'
+
+def tile_image(imagef,args,shard_index=0,shard_count=1,runstats=None):
     """
-    Summary: marks pixels with elts that are all finite as valid
-    
-    Arguments:
-    - img: image array
-    
-    Keyword Arguments:
-    None
+    collects and saves the tiles of image imagef assigned to shard 
+    shard_index, returns the (image, tileid, ul) rows for the shard
+    """
+    imagename = splitext(basename(imagef))[0]
+    tiledir = pathjoin(args.outdir,imagename)
+    tileext = args.ext
+    tilesave = savefunc
+    imageload = loadfunc
+    if args.codec is not None:
+        _,tilesave,tileext = get_codec(args.codec)
+        # dtype-preserving loaders, codec tiles keep the image dtype
+        imageload = NumpyLoader() if imagef.endswith('.npy') else PILImageLoader()
+
+    image = imageload(imagef)
+    mask  = maskfunc(image,imgf=imagef)
+
+    if args.plot:
+        import pylab as pl
+        imggrid = bands2grid(image,1,orientation='square')
+        pl.imshow(imggrid.squeeze())
+        pl.show()
+
+    # per-image seed so tiles do not depend on which shard handles the image
+    tiler = MaskTiler(mask,args.tiledim,numtiles=args.numtiles,
+                      accept=args.accept,replacement=args.replacement,
+                      verbose=args.verbose,
+                      random_state=(args.seed+stable_hash(imagename))%(2**32))
+    ul = sorted(tiler.collect())
+    tileids = list(range(len(ul)))
+    if args.shard_tiles:
+        start,stop = shard_range(len(ul),shard_index,shard_count)
+        ul,tileids = ul[start:stop],tileids[start:stop]
+
+    save_tiles(image,ul,args.tiledim,tiledir,tileext,tilesave,outprefix='tile',
+               overwrite=args.clobber,manifest=[SHARD_MANIFEST%shard_index,MANIFEST_FILE],
+               statmask=mask,runstats=runstats)
+    return [(imagename,tid,tul) for tid,tul in zip(tileids,ul)]
+
+def run_shard(shard_index,shard_count,args):
+    """
+    tiles the images assigned to shard shard_index and writes its tileinfo
+    """
+    if args.shard_tiles:
+        imagefs = args.image
+    else:
+        imagefs = [imagef for imagef in args.image
+                   if shard_of(splitext(basename(imagef))[0],shard_count)==shard_index]
+    print('shard %d/%d: %d images'%(shard_index,shard_count,len(imagefs)))
     
-    Output:
-    - boolean mask with the same number of pixels as img
+    tinfo = []
+    runstats = RunningStats() if args.stats else None
+    for imagef in imagefs:
+        tinfo.extend(tile_image(imagef,args,shard_index,shard_count,runstats))
+
+    if not pathexists(args.outdir):
+        os.makedirs(args.outdir)
+    if runstats is not None:
+        runstats.save(pathjoin(args.outdir,SHARD_STATS%shard_index))
+    tileinfof = pathjoin(args.outdir,SHARD_TILEINFO%shard_index)
+    images,tileids,ul = [list(t) for t in zip(*tinfo)] if tinfo else ([],[],[])
+    summarize_tiles(ul,args.tiledim,tileinfof,image=images,tileids=tileids)
+    return tileinfof
+
+def merge_shards(outdir):
+    """
+    merges per-shard tileinfo files and manifests in outdir
     """
-    def __call__(self, img, **kwargs):
-        import numpy as np
-        if isinstance(img,str) and pathexists(img):
-            img = loadfunc(img)
-        return np.isfinite(np.atleast_3d(img)).all(axis=2)
+    import glob
+    tileinfofs = sorted(glob.glob(pathjoin(outdir,SHARD_TILEINFO.replace('%03d','*'))))
+    tileinfof = pathjoin(outdir,TILEINFO_FILE)
+    if len(tileinfofs)!=0:
+        # shard rows replace the rows of their images in a previous merge
+        merge_tileinfo(tileinfofs,tileinfof,base=tileinfof)
+    for tileinfof in tileinfofs:
+        os.remove(tileinfof)
 
-maskfunc = DefaultMasker()
+    statfs = sorted(glob.glob(pathjoin(outdir,SHARD_STATS.replace('%03d','*'))))
+    if len(statfs)!=0:
+        # shard stats cover newly extracted tiles, add them to earlier merges
+        statsf = pathjoin(outdir,STATS_FILE)
+        runstats = RunningStats.load(statsf) if pathexists(statsf) else RunningStats()
+        for statf in statfs:
+            runstats.merge(RunningStats.load(statf))
+            os.remove(statf)
+        runstats.save(statsf)
+        print('Dataset tile statistics:',runstats)
+    
+    nmanifest = 0
+    for tiledir in sorted(glob.glob(pathjoin(outdir,'*'))):
+        manifestfs = sorted(glob.glob(pathjoin(tiledir,SHARD_MANIFEST.replace('%03d','*'))))
+        if len(manifestfs)==0:
+            continue
+        manifestf = pathjoin(tiledir,MANIFEST_FILE)
+        merge_manifests([manifestf]+manifestfs,manifestf)
+        for shardf in manifestfs:
+            os.remove(shardf)
+        nmanifest += 1
+    print('Merged',len(tileinfofs),'tileinfo files and',nmanifest,'manifests in',
+          outdir)
 
 if __name__ == '__main__':
     import argparse
@@ -45,44 +133,59 @@ if __name__ == '__main__':
                        help='Overwrite image tiles if they already exist')
     parser.add_argument('-e','--ext', type=str, default='.png',
                        help='Output file extension')    
+    parser.add_argument('-k','--codec', type=str, default=None,
+                        choices=sorted(CODECS),
+                        help='Tile codec (overrides --ext)')
+    parser.add_argument('--mask-cache', type=str, default=None,
+                        help='Directory for cached image mask sidecar files')
+    parser.add_argument('-p','--plot', action='store_true',
+                       help='Plot each image before tiling')
+    parser.add_argument('--stats', action='store_true',
+                        help='Accumulate per-band dataset statistics of the '
+                        'valid tile pixels in OUTDIR/'+STATS_FILE)
     parser.add_argument('-v','--verbose', action='store_true',
                        help='Enable verbose output')
-    parser.add_argument('image', type=str, metavar='IMAGE',
-                       help='Image to tile')
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='Index of the shard to run on this node')
+    parser.add_argument('--shard-count', type=int, default=1,
+                        help='Total number of shards')
+    parser.add_argument('--shard-tiles', action='store_true',
+                        help='Split tile index ranges within each image '
+                        'across shards instead of assigning whole images')
+    parser.add_argument('-j','--jobs', type=int, default=0,
+                        help='Run JOBS shards in local processes, then merge')
+    parser.add_argument('-m','--merge', action='store_true',
+                        help='Merge shard outputs in OUTDIR after all shards finish')
+    parser.add_argument('image', type=str, metavar='IMAGE', nargs='*',
+                       help='Images to tile')
     args = parser.parse_args()
 
-    np.random.seed(args.seed)
+    if args.shard_tiles and args.clobber:
+        parser.error('--clobber cannot be combined with --shard-tiles')
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error('--shard-index must be in [0,--shard-count)')
 
-    verbose = args.verbose
-    
-    imagef = args.image
-    imagebase,imageext = splitext(imagef)
-    
-    # output dir / extension for tile images
-    tiledir = args.outdir
-    tileext = args.ext 
-
-    # tile parameters
-    tiledim  = args.tiledim
-    numtiles = args.numtiles
-    accept   = args.accept
-    replace  = args.replacement
-
-    image = loadfunc(imagef)
-    mask  = maskfunc(image)
-
-    imggrid = bands2grid(image,1,orientation='square')
-    pl.imshow(imggrid.squeeze())
-    pl.show()
-    
-    tiledir = pathjoin(tiledir,splitext(basename(imagef))[0])
-    if not pathexists(tiledir):
-        os.makedirs(tiledir)
-    
-    tiler = MaskTiler(mask,tiledim,numtiles,accept=accept,
-                      replacement=replace,verbose=verbose)
+    if args.clobber:
+        for mergedf in (TILEINFO_FILE,STATS_FILE):
+            if pathexists(pathjoin(args.outdir,mergedf)):
+                os.remove(pathjoin(args.outdir,mergedf))
 
-    ul = tiler.collect()
-    save_tiles(image,ul,tiledim,tiledir,tileext,savefunc,outprefix='tile')
+    if args.mask_cache is not None:
+        maskfunc = CachedMasker(maskfunc,cachedir=args.mask_cache)
 
+    if args.jobs > 0:
+        from functools import partial
+        from multiprocessing import Pool
+        pool = Pool(args.jobs)
+        pool.map(partial(run_shard,shard_count=args.jobs,args=args),
+                 range(args.jobs))
+        pool.close()
+        merge_shards(args.outdir)
+    elif len(args.image)!=0:
+        run_shard(args.shard_index,args.shard_count,args)
+        if args.shard_count==1 or args.merge:
+            merge_shards(args.outdir)
+    elif args.merge:
+        merge_shards(args.outdir)
+        
     sys.exit(0)
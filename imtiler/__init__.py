@@ -4,11 +4,16 @@ from .basetiler import *
 from .recttiler import *
 from .masktiler import *
 from .coveragetiler import *
+from .weightedtiler import *
 from .regiontiler import *
 from .classmasktiler import *
 from .detectiontiler import *
+from .stripetiler import *
 
 __all__ = ['RectTiler','RegionTiler','CoverageTiler','MaskTiler',
-           'ClassMaskTiler','DetectionTiler',
-           'extract_tiles','save_tiles','plot_tiles',
-           'savefunc','loadfunc','maskfunc']
+           'ClassMaskTiler','DetectionTiler','StripeTiler',
+           'WeightedTiler',
+           'extract_tiles','coextract_tiles','save_tiles','plot_tiles',
+           'savefunc','loadfunc','maskfunc',
+           'register_codec','get_codec','benchmark_codecs','ExcludeSet',
+           'RunningStats']
@@ -14,21 +14,139 @@ class BaseTiler(object):
         self.tiledim  = tiledim
         self.verbose  = kwargs.pop('verbose',True)
         self.ul       = []
+        self.tiles    = []
+        # exclude_coords/exclude_rects/exclude_mask -> excluded upper-left coords
+        self.exclude  = pop_exclude(kwargs)
 
         np.random.seed(self.rndstate)
 
     def collect(self):
         pass
 
+    def mark_seen(self, ul_list):
+        """
+        marks tiles with upper-left coords in ul_list as previously selected,
+        no-op for tilers that do not track overlap
+        """
+        pass
+
+    def get_state(self):
+        """
+        returns dict of arrays describing the sampler state (collected tiles
+        + numpy RNG state), subclasses add their own masks/visited positions
+        """
+        rngname,rngkeys,rngpos,rnggauss,rngcached = np.random.get_state()
+        # ul keeps collection order (per-tile lists like percent_seen follow it)
+        return dict(tiledim=np.int64(self.tiledim),
+                    ul=np.int64(self.ul).reshape([-1,2]),
+                    rng_keys=rngkeys,rng_pos=np.int64(rngpos),
+                    rng_gauss=np.int64(rnggauss),
+                    rng_cached=np.float64(rngcached))
+
+    def set_state(self, state):
+        """
+        restores the sampler state returned by get_state
+        """
+        if int(state['tiledim']) != self.tiledim:
+            msg = 'checkpoint tiledim %d != tiledim %d'%(int(state['tiledim']),
+                                                         self.tiledim)
+            raise Exception(msg)
+        self.ul = array2coords(state['ul'])
+        self.tiles = [(slice(i,i+self.tiledim,None),
+                       slice(j,j+self.tiledim,None)) for i,j in self.ul]
+        np.random.set_state(('MT19937',state['rng_keys'],int(state['rng_pos']),
+                             int(state['rng_gauss']),
+                             float(state['rng_cached'])))
+
+    def save_state(self, statef):
+        """
+        writes the sampler state to compressed checkpoint file statef (.npz)
+        """
+        with open(statef,'wb') as fid:
+            np.savez_compressed(fid,**self.get_state())
+
+    def load_state(self, statef):
+        """
+        restores the sampler state from checkpoint file statef, the tiler
+        must be constructed with the same mask and tiledim as the original
+        """
+        with np.load(statef) as state:
+            self.set_state(dict(state))
+
     def extract(self, img, **kwargs):
         ul = self.collect()            
         return extract_tiles(img,ul,self.tiledim,**kwargs)
 
     def save(self, img, outdir, outext, savefunc, **kwargs):
         ul = self.collect()            
-        return save_tiles(img,ul,self.tiledim,**kwargs)
+        return save_tiles(img,ul,self.tiledim,outdir,outext,savefunc,**kwargs)
     
     def plot(self, img, **kwargs):
         ul = self.collect()            
         return plot_tiles(img,ul,self.tiledim,**kwargs)
-    
+
+class SamplingTiler(BaseTiler):
+    """
+    SamplingTiler(tiledim,**kwargs)
+
+    Summary: base class of tilers that draw tiles one at a time with a 
+    next() method (returning tile slices, None if no tile can be sampled),
+    adds incremental collection (extend) on top of the BaseTiler state
+    """
+    def _next_tile(self, i):
+        # returns (tij, fields) for draw i of extend: tij=None stops sampling,
+        # fields=None discards tij, otherwise fields = dict of (attribute,
+        # value) pairs appended to per-tile lists along with tij
+        tij = self.next()
+        if self.verbose and tij is not None:
+            print(i,tile2str(tij))
+        return tij, {}
+
+    def extend(self, numtiles, **kwargs):
+        """
+        extend(self, numtiles, checkpoint=None, checkpoint_every=1000)
+
+        Summary: samples up to numtiles additional tiles, continuing from the
+        current sampler state and appending them to self.ul
+        
+        Arguments:
+        - numtiles: number of additional tiles to sample
+        
+        Keyword Arguments:
+        - checkpoint: state file to update during sampling (default None)
+        - checkpoint_every: number of tiles between checkpoint updates
+        
+        Output:
+        - list of upper-left coords of all collected tiles
+        """
+        checkpoint = kwargs.pop('checkpoint',None)
+        checkpoint_every = kwargs.pop('checkpoint_every',1000)
+
+        seen = set(self.ul)
+        if self.verbose:
+            print('Collecting up to',numtiles,'tiles')
+            print('Image dims: (%d x %d)'%(self.nrows,self.ncols))
+            print('Tile dims: (%d x %d)'%(self.tiledim,self.tiledim))
+
+        numtiles_prev = len(self.ul)
+        for i in range(numtiles):
+            tij,fields = self._next_tile(i)
+            if tij is None:
+                break
+            tul = (tij[0].start,tij[1].start)
+            if fields is not None and tul not in seen:
+                seen.add(tul)
+                self.tiles.append(tij)
+                self.ul.append(tul)
+                for key,val in fields.items():
+                    getattr(self,key).append(val)
+
+            if checkpoint and (i+1)%checkpoint_every==0:
+                self.save_state(checkpoint)
+
+        numtiles_new = len(self.ul)-numtiles_prev
+        print('Collected',numtiles_new,'of',numtiles,'requested tiles')
+        self.numtiles = len(self.ul)
+        if checkpoint:
+            self.save_state(checkpoint)
+        return self.ul
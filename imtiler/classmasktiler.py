@@ -5,6 +5,7 @@ from .basetiler import *
 from .recttiler import *
 from .regiontiler import *
 from .masktiler import *
+from .weightedtiler import *
 
 from skimage.measure import label as imlabel
 
@@ -30,6 +31,11 @@ class ClassMaskTiler(BaseTiler):
         self.ntprand = kwargs.pop('ntprand',MIN_TILES)
         self.tp_conn = kwargs.pop('tp_conn',8) # collect octtiles for fp
         self.fp_conn = kwargs.pop('fp_conn',1) # don't collect quadtiles for fp
+        # 'weighted' draws tp/tn tiles from WeightedTiler instead of rejection
+        self.tp_mode = kwargs.pop('tp_mode','coverage')
+        self.tn_mode = kwargs.pop('tn_mode','mask')
+        self.tp_weights = kwargs.pop('tp_weights',None)
+        self.tn_weights = kwargs.pop('tn_weights',None)
 
         print('orig mask alignment:',(self.fpmask & self.tpmask).sum())
         print('flip mask alignment:',(self.fpmask & np.flipud(self.tpmask)).sum())
@@ -39,16 +45,21 @@ class ClassMaskTiler(BaseTiler):
             return self.tile_ul              
         
         # collect (upper-left) coords for true positives first
-        tiler = RectTiler(self.tpcomp,self.tiledim,conn=self.tp_conn)
+        tiler = RectTiler(self.tpcomp,self.tiledim,conn=self.tp_conn,
+                          exclude_coords=self.exclude)
         self.tile_ul['tp'] = tiler.collect()
         ntp_base = len(self.tile_ul['tp'])
 
         if self.ntprand != 0:
             raccept=0.75 #'none' # 'min' # 
+            # exclude the tp tiles collected above
+            tpexclude = self.exclude.copy()
+            tpexclude.update(self.tile_ul['tp'])
             # get another ntprand random tiles for each tp component    
             tptiler = RegionTiler(self.tpcomp,self.tiledim,numtiles=self.ntprand,
-                                  accept=raccept,exclude_coords=tp,mode='coverage',
-                                  verbose=self.verbose)
+                                  accept=raccept,exclude_coords=tpexclude,
+                                  mode=self.tp_mode,
+                                  weights=self.tp_weights,verbose=self.verbose)
             self.tile_ul['tp'].extend(tptiler.collect())
 
         self.ntp = len(self.tile_ul['tp'])
@@ -58,9 +69,7 @@ class ClassMaskTiler(BaseTiler):
         if self.tnmask.any():
             # accept no overlapping tiles with tpmask, but sample with replacemen
             ntn = self.ntn if (self.ntn != MATCH_POS) else ntp_base
-            tntiler = MaskTiler(self.tnmask,self.tiledim,numtiles=ntn,accept='none',
-                                replacement=True,verbose=self.verbose)
-            self.tile_ul['tn'] = tntiler.collect()
+            self.tile_ul['tn'] = self.collect_tn(ntn)
             
         self.ntn = len(self.tile_ul['tn'])
         print(self.ntn,'tn tiles')
@@ -72,10 +81,26 @@ class ClassMaskTiler(BaseTiler):
             if nfp > MAX_TILES:
                 ufplab = randperm(ufplab)[:MAX_TILES]            
             fptiler = RectTiler(self.fpcomp,self.tiledim,rclab=ufplab,
-                                mask=self.tpmask,conn=self.fp_conn)
+                                mask=self.tpmask,conn=self.fp_conn,
+                                exclude_coords=self.exclude)
             self.tile_ul['fp'] = fptiler.collect()
 
         self.nfp = len(self.tile_ul['fp'])
         print(self.nfp,'fp tiles')
 
         return self.tile_ul
+
+    def collect_tn(self,ntn):
+        # tn tiles cannot overlap any pixels outside tnmask
+        if self.tn_mode=='weighted':
+            weights = self.tnmask if self.tn_weights is None else self.tn_weights
+            tntiler = WeightedTiler(weights,self.tiledim,numtiles=ntn,
+                                    mask=self.tnmask,mincover=1.0,
+                                    exclude_coords=self.exclude,
+                                    verbose=self.verbose)
+        else:
+            tntiler = MaskTiler(self.tnmask,self.tiledim,numtiles=ntn,
+                                accept='none',replacement=True,
+                                exclude_coords=self.exclude,
+                                verbose=self.verbose)
+        return tntiler.collect()
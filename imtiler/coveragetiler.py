@@ -2,6 +2,7 @@ from __future__ import absolute_import, print_function, division
 
 from .util import *
 from .basetiler import *
+from .kernels import get_kernels
 from numpy.random import randint
 
 def setdiff2d(A1,A2):
@@ -13,7 +14,7 @@ def setdiff2d(A1,A2):
     return np.setdiff1d(A1_rows, A2_rows).view(A1.dtype).reshape(-1, A1.shape[1])
 
 
-class CoverageTiler(BaseTiler):
+class CoverageTiler(SamplingTiler):
     """
     MaskTiler(mask,tiledim,numtiles,maxsearch=1000,accept=0.5,reinit_mask=True,
               replacement=False,verbose=False)
@@ -28,6 +29,8 @@ class CoverageTiler(BaseTiler):
     Keyword Arguments:
     - accept: max percentage of seen (mask==1) pixels/tile to accept
               (smaller values == less overlap)
+    - backend: search loop backend, 'python', 'kernel' or 'numba' (see
+               kernels.get_kernels, default 'python')
     
     Output:
     - tileij = list of tiledim x tiledim tiles (2d slices) to use to extract subimages
@@ -37,7 +40,8 @@ class CoverageTiler(BaseTiler):
         super(CoverageTiler,self).__init__(tiledim,**kwargs)
         self.numtiles    = kwargs.pop('numtiles',MIN_TILES)
         self.accept      = kwargs.pop('accept',0.75)
-        self.exclude     = kwargs.pop('exclude_coords',[])
+        self.backend     = kwargs.pop('backend','python')
+        self.searchfunc  = get_kernels(self.backend)[1]
         
         nrows,ncols = mask.shape[0],mask.shape[1]         
         if nrows<tiledim or ncols<tiledim:
@@ -73,12 +77,18 @@ class CoverageTiler(BaseTiler):
         self.npixij = self.npixi*self.npixj
         #self.pixij    = np.meshgrid(self.rowrange,self.colrange)
         #self.pixij    = np.int32(np.c_[self.pixij].reshape([2,-1]).T)
-        self.visted = set([])
-        if len(self.exclude)!=0:
-            exclude = set(self.exclude)
+        self.visited = set([])
+        self.tiles = []
+        if self.searchfunc is not None:
+            # search kernels track visited/excluded positions in masks
+            self.visited  = np.zeros([nrows,ncols],dtype=np.uint8)
+            self.nvisited = 0
+            self.excluded = self.exclude.tomask([nrows,ncols])
         self.mincover = int(self.accept*self.nmask)
         
     def next(self):
+        if self.searchfunc is not None:
+            return self._next_kernel()
         for ipixij in range(self.npixij):
             if len(self.visited)==self.npixij:
                 self.visited = set([])
@@ -100,33 +110,39 @@ class CoverageTiler(BaseTiler):
                 return tij
         return None
 
+    def _next_kernel(self):
+        # runs the search loop in a kernel seeded from the numpy rng
+        seed = randint(1,2**31)
+        i,j,self.nvisited,_ = self.searchfunc(self.mask,self.visited,
+                                              self.nvisited,self.excluded,
+                                              self.pixi,self.pixj,self.tiledim,
+                                              self.mincover,seed)
+        if i < 0:
+            return None
+        return (slice(i,i+self.tiledim,None),slice(j,j+self.tiledim,None))
+
+    def get_state(self):
+        state = super(CoverageTiler,self).get_state()
+        state.update(visited=np.argwhere(self.visited)
+                     if self.searchfunc is not None else
+                     coords2array(self.visited),
+                     shape=np.int64([self.nrows,self.ncols]))
+        return state
+
+    def set_state(self,state):
+        if tuple(state['shape']) != (self.nrows,self.ncols):
+            msg = 'checkpoint mask shape %s != mask shape %s'
+            raise Exception(msg%(str(tuple(state['shape'])),
+                                 str((self.nrows,self.ncols))))
+        super(CoverageTiler,self).set_state(state)
+        self.visited = set(array2coords(state['visited']))
+        if self.searchfunc is not None:
+            self.visited  = np.zeros([self.nrows,self.ncols],dtype=np.uint8)
+            self.visited[tuple(np.int64(state['visited']).reshape([-1,2]).T)] = 1
+            self.nvisited = int(self.visited.sum())
+
     @timeit
     def collect(self):
         if self.ul != []:
             return self.ul
-
-        ul = []
-        tiles = []
-
-        if self.verbose:
-            nrows,ncols = self.mask.shape[:2]
-            print('Collecting up to',self.numtiles,'tiles')
-            print('Image dims: (%d x %d)'%(nrows,ncols))
-            print('Tile dims: (%d x %d)'%(self.tiledim,self.tiledim))
-            
-        for i in range(self.numtiles):
-            tij = self.next()
-            if tij==None:
-                break
-            if self.verbose:
-                print(i,tile2str(tij))
-
-            tiles.append(tij)
-            ul.append((tij[0].start,tij[1].start))
-
-        self.tiles = tiles
-        numtiles = len(tiles)
-        print('Collected',numtiles,'of',self.numtiles,'requested tiles')
-        self.numtiles = numtiles
-        self.ul = list(set(ul))
-        return self.ul
+        return self.extend(self.numtiles)
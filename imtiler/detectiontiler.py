@@ -18,11 +18,12 @@ class DetectionTiler(ClassMaskTiler):
         - tiledim: tiledim
         
         Keyword Arguments:
-
+        - margin: min distance in pixels between negative tiles and detections
         
         Output:
         - output
         """
+        self.margin = kwargs.pop('margin',0)
         tpmask,tnmask,fpmask = detmask,~detmask,np.zeros_like(detmask)
         kwargs.setdefault('ntprand',0)
         kwargs.setdefault('tp_conn',0)
@@ -32,6 +33,25 @@ class DetectionTiler(ClassMaskTiler):
         super(DetectionTiler,self).__init__(tpmask,tnmask,fpmask,
                                             tiledim,**kwargs)
 
+    def collect_tn(self,ntn):
+        if self.tn_mode=='weighted':
+            return super(DetectionTiler,self).collect_tn(ntn)
+        
+        # draw negatives from upper-left positions whose footprint (+margin)
+        # contains no detections, so every draw is valid
+        freeul = footprint_free(self.tpmask,self.tiledim,self.margin)
+        freeul &= self.exclude.tomask(freeul.shape)==0
+        freeidx = np.flatnonzero(freeul)
+        nfree = len(freeidx)
+        if nfree <= ntn:
+            sel = set(freeidx.tolist())
+        else:
+            sel = set([])
+            while len(sel) < ntn:
+                sel.update(freeidx[randint(nfree,size=ntn-len(sel))].tolist())
+        nulcols = freeul.shape[1]
+        return [(idx//nulcols,idx%nulcols) for idx in sorted(sel)]
+
     def collect(self):
         ul = super(DetectionTiler,self).collect()
         return dict(pos=ul['tp'],neg=ul['tn'])
@@ -0,0 +1,159 @@
+from __future__ import absolute_import, print_function, division
+
+# search kernels for the MaskTiler and CoverageTiler sampling loops: each
+# kernel runs a tiler's whole search loop over plain arrays (visited
+# positions are a uint8 mask instead of a set) and draws random numbers from
+# an xorshift32 generator seeded by the caller, so compiled (numba) and
+# interpreted kernels give identical results for the same seed. numba is
+# imported (and the kernels compiled) on the first 'numba' backend request
+
+import numpy as np
+from warnings import warn
+
+def _make_kernels(jit):
+    @jit
+    def xorshift(x):
+        # xorshift32, values fit in int64 so numba/python ints agree
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        return x
+
+    @jit
+    def masksearch(maskseen,masksum,maskskip,visited,nvisited,excluded,pixr,
+                   pixc,tiledim,ntilei,ntilej,rowdim,coldim,maxsearch,maxseen,
+                   maxreinit,reinit_seen,replacement,seed):
+        # mirrors MaskTiler.next, returns (row,col) of the best tile (-1 if
+        # none), its number of seen pixels, whether it was accepted (caller
+        # marks it seen), nvisited and the final rng state
+        nrows,ncols = maskseen.shape[0],maskseen.shape[1]
+        npixr,npixc = len(pixr),len(pixc)
+        ntilepix = tiledim*tiledim
+        ntileij = ntilei*ntilej
+        nvisitmax = ntileij*npixr*npixc
+        bi,bj,tijseen,tijover = -1,-1,ntilepix,-1
+        x = seed
+        nreinit = 0
+        nsearch = 0
+        accepted = False
+        x = xorshift(x)
+        r = pixr[x%npixr]
+        x = xorshift(x)
+        c = pixc[x%npixc]
+        while nsearch <= maxsearch:
+            for itileij in range(ntileij):
+                if nvisited==nvisitmax:
+                    visited[:,:] = 0
+                    nvisited = 0
+                x = xorshift(x)
+                ti = x%ntilei
+                x = xorshift(x)
+                tj = x%ntilej
+                i,j = (ti*tiledim)+r,(tj*tiledim)+c
+                if i+tiledim>=nrows or j+tiledim>=ncols or visited[i,j]!=0 or \
+                   excluded[i,j]!=0:
+                    continue
+                visited[i,j] = 1
+                nvisited += 1
+
+                nseen = np.count_nonzero(maskseen[i:i+tiledim,j:j+tiledim])
+                if nseen<tijseen or replacement:
+                    nover = np.int64(masksum[i:i+tiledim,j:j+tiledim].max())
+                    if tijover<0 or nover<=tijover:
+                        bi,bj,tijseen,tijover = i,j,nseen,nover
+                        if nseen<=maxseen:
+                            nsearch = maxsearch
+                            break
+
+            if nsearch>=maxsearch:
+                if reinit_seen and tijseen>maxseen:
+                    maskseen[:,:] = maskskip
+                    x = xorshift(x)
+                    r = pixr[x%npixr]
+                    x = xorshift(x)
+                    c = pixc[x%npixc]
+                    bi,bj,tijseen,tijover = -1,-1,ntilepix,-1
+                    nsearch = 0
+                    nreinit += 1
+                    if nreinit > maxreinit:
+                        break
+                else:
+                    accepted = True
+                    break
+
+            x = xorshift(x)
+            if x%2==1:
+                x = xorshift(x)
+                r = (r+x%ntilei)%rowdim
+            else:
+                x = xorshift(x)
+                c = (c+x%ntilej)%coldim
+            nsearch += 1
+
+        return bi,bj,tijseen,accepted,nvisited,x
+
+    @jit
+    def coversearch(mask,visited,nvisited,excluded,pixi,pixj,tiledim,mincover,
+                    seed):
+        # mirrors CoverageTiler.next, returns (row,col) of the first tile
+        # covering >= mincover mask pixels (-1 if none), nvisited, rng state
+        nrows,ncols = mask.shape[0],mask.shape[1]
+        npixi,npixj = len(pixi),len(pixj)
+        npixij = npixi*npixj
+        x = seed
+        for ipixij in range(npixij):
+            if nvisited==npixij:
+                visited[:,:] = 0
+                nvisited = 0
+            x = xorshift(x)
+            i = pixi[x%npixi]
+            x = xorshift(x)
+            j = pixj[x%npixj]
+            if i+tiledim>=nrows or j+tiledim>=ncols or excluded[i,j]!=0 or \
+               visited[i,j]!=0:
+                continue
+            visited[i,j] = 1
+            nvisited += 1
+            if np.count_nonzero(mask[i:i+tiledim,j:j+tiledim]) >= mincover:
+                return i,j,nvisited,x
+        return -1,-1,nvisited,x
+
+    return masksearch, coversearch
+
+masksearch_py, coversearch_py = _make_kernels(lambda func: func)
+_jit_kernels = None # (masksearch, coversearch), False if numba unavailable
+
+def _get_jit_kernels():
+    global _jit_kernels
+    if _jit_kernels is None:
+        try:
+            from numba import njit
+            _jit_kernels = _make_kernels(njit)
+        except ImportError:
+            _jit_kernels = False
+    return _jit_kernels
+
+def get_kernels(backend):
+    """
+    get_kernels(backend)
+
+    Summary: returns the (masksearch, coversearch) kernels for a tiler backend
+
+    Arguments:
+    - backend: 'python' (no kernel, tilers use their own loops), 'kernel'
+               (interpreted kernels) or 'numba' (compiled kernels, falls back
+               to 'kernel' if numba is unavailable)
+
+    Output:
+    - (masksearch, coversearch) tuple, (None, None) for backend='python'
+    """
+    if backend=='python':
+        return None, None
+    if backend=='numba':
+        jit_kernels = _get_jit_kernels()
+        if jit_kernels:
+            return jit_kernels
+        warn('numba unavailable, using interpreted search kernels')
+    elif backend!='kernel':
+        raise Exception('unknown backend "%s"'%str(backend))
+    return masksearch_py, coversearch_py
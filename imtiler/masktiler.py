@@ -2,9 +2,10 @@ from __future__ import absolute_import, print_function, division
 
 from .util import *
 from .basetiler import *
+from .kernels import get_kernels
 from numpy.random import randint, choice
         
-class MaskTiler(BaseTiler):
+class MaskTiler(SamplingTiler):
     """
     MaskTiler(mask,tiledim,numtiles,maxsearch=1000,accept=0.5,reinit_seen=True,
               replacement=False,verbose=False)
@@ -19,6 +20,8 @@ class MaskTiler(BaseTiler):
     Keyword Arguments:
     - accept: max percentage of seen (mask==1) pixels/tile to accept
               (smaller values == less overlap)
+    - backend: search loop backend, 'python', 'kernel' or 'numba' (see
+               kernels.get_kernels, default 'python')
     
     Output:
     - tileij = list of tiledim x tiledim tiles (2d slices) to use to extract subimages
@@ -34,7 +37,8 @@ class MaskTiler(BaseTiler):
         self.accept      = kwargs.pop('accept',0.5)        
         self.verbose     = kwargs.pop('verbose',False)
         self.maxreinit   = kwargs.pop('maxreinit',10)
-        self.exclude     = kwargs.pop('exclude_coords',[])
+        self.backend     = kwargs.pop('backend','python')
+        self.searchfunc  = get_kernels(self.backend)[0]
         
         nrows,ncols = mask.shape[0],mask.shape[1]         
         if nrows<tiledim or ncols<tiledim:
@@ -42,6 +46,7 @@ class MaskTiler(BaseTiler):
             raise Exception(msg)
 
         self.tiles     = []
+        self.percent_seen = []
         self.nrows     = nrows
         self.ncols     = ncols
         self.tiledim   = tiledim
@@ -102,6 +107,11 @@ class MaskTiler(BaseTiler):
         self.tilei     = np.arange(self.ntilei)
         self.tilej     = np.arange(self.ntilej)
         self.visited   = set([])
+        if self.searchfunc is not None:
+            # search kernels track visited positions in a mask
+            self.visited  = np.zeros([nrows,ncols],dtype=np.uint8)
+            self.nvisited = 0
+            self.excluded = self.exclude.tomask([nrows,ncols])
         #self.tileij    = np.meshgrid(tilei,tilej)
         #self.tileij    = np.c_[self.tileij].reshape([2,-1]).T
 
@@ -117,6 +127,9 @@ class MaskTiler(BaseTiler):
             warn('no pixel offsets defined, cannot proceed')
             return (tijbest, tijseen)
 
+        if self.searchfunc is not None:
+            return self._next_kernel()
+
         nreinit = 0
         nsearch = 0
         
@@ -134,7 +147,7 @@ class MaskTiler(BaseTiler):
                 ti,tj = choice(self.tilei),choice(self.tilej)
                 i,j = (ti*self.tiledim)+r,(tj*self.tiledim)+c
                 if (i,j) in self.visited or i+self.tiledim>=self.nrows or \
-                   j+self.tiledim>=self.ncols:
+                   j+self.tiledim>=self.ncols or (i,j) in self.exclude:
                     #  TODO (BDB, 02/21/17): allow padding here? 
                     continue
                 else:
@@ -192,43 +205,75 @@ class MaskTiler(BaseTiler):
                     
         return (tijbest, tijseen)
     
+    def _next_kernel(self):
+        # runs the search loop in a kernel seeded from the numpy rng
+        seed = randint(1,2**31)
+        bi,bj,tijseen,accepted,self.nvisited,_ = self.searchfunc(
+            self.maskseen,self.masksum,self.maskskip,self.visited,self.nvisited,
+            self.excluded,self.pixr,self.pixc,self.tiledim,self.ntilei,self.ntilej,
+            self.rowdim,self.coldim,self.maxsearch,self.maxseen,self.maxreinit,
+            bool(self.reinit_seen),bool(self.replacement),seed)
+        if bi < 0:
+            return (None, tijseen)
+        tij = (slice(bi,bi+self.tiledim,None),slice(bj,bj+self.tiledim,None))
+        if accepted and not self.replacement:
+            self.maskseen[tij] += 1
+            self.masksum[tij] += 1
+        return (tij, tijseen)
+
+    def _next_tile(self,i):
+        tij,tijseen = self.next()
+        if tij is None:
+            return None, None
+        tijpercent = tijseen/self.ntilepix
+        if self.verbose:
+            print(i,tile2str(tij),'%5.4f'%tijpercent)
+
+        # if strict mode on, discard 'best match' tiles below criteria
+        if self.strict and tijseen > self.maxseen:
+            if self.verbose:
+                print('skipped %d: tijseen=%d > maxseen=%d'%(i,tijseen,
+                                                             self.maxseen))
+            return tij, None
+        return tij, dict(percent_seen=tijpercent)
+
+    def mark_seen(self,ul_list):
+        # coords may be out of bounds (e.g., tiles carried across stripes)
+        for i,j in ul_list:
+            tij = (slice(max(0,i),max(0,i+self.tiledim),None),
+                   slice(max(0,j),max(0,j+self.tiledim),None))
+            self.maskseen[tij] += 1
+            self.masksum[tij] += 1
+
+    def get_state(self):
+        state = super(MaskTiler,self).get_state()
+        state.update(maskseen=self.maskseen,masksum=self.masksum,
+                     visited=np.argwhere(self.visited)
+                     if self.searchfunc is not None else
+                     coords2array(self.visited),
+                     percent_seen=np.float64(self.percent_seen),
+                     pixr=self.pixr,pixc=self.pixc)
+        return state
+
+    def set_state(self,state):
+        if state['maskseen'].shape != self.maskseen.shape:
+            msg = 'checkpoint mask shape %s != mask shape %s'
+            raise Exception(msg%(str(state['maskseen'].shape),
+                                 str(self.maskseen.shape)))
+        super(MaskTiler,self).set_state(state)
+        self.maskseen     = np.uint32(state['maskseen'])
+        self.masksum      = np.uint32(state['masksum'])
+        self.visited      = set(array2coords(state['visited']))
+        if self.searchfunc is not None:
+            self.visited  = np.zeros([self.nrows,self.ncols],dtype=np.uint8)
+            self.visited[tuple(np.int64(state['visited']).reshape([-1,2]).T)] = 1
+            self.nvisited = int(self.visited.sum())
+        self.percent_seen = list(state['percent_seen'])
+        self.pixr         = state['pixr']
+        self.pixc         = state['pixc']
+
     @timeit
     def collect(self):
         if self.ul != []:
             return self.ul
-
-        ul = []
-        tiles = []
-        percent_seen = []
-
-        if self.verbose:
-            nrows,ncols = self.maskskip.shape[:2]
-            print('Collecting up to',self.numtiles,'tiles')
-            print('Image dims: (%d x %d)'%(nrows,ncols))
-            print('Tile dims: (%d x %d)'%(self.tiledim,self.tiledim))
-            
-        for i in range(self.numtiles):
-            tij,tijseen = self.next()
-            if tij==None:
-                break
-            tijpercent = tijseen/self.ntilepix
-            if self.verbose:
-                print(i,tile2str(tij),'%5.4f'%tijpercent)
-
-            # if strict mode on, discard 'best match' tiles below criteria
-            if self.strict and tijseen > self.maxseen:
-                if self.verbose:
-                    print('skipped %d: tijseen=%d > maxseen=%d'%(i,tijseen,
-                                                                 self.maxseen))
-                continue
-            tiles.append(tij)
-            ul.append((tij[0].start,tij[1].start))
-            percent_seen.append(tijpercent)
-
-        self.tiles = tiles
-        self.percent_seen = percent_seen
-        numtiles = len(tiles)
-        print('Collected',numtiles,'of',self.numtiles,'requested tiles')
-        self.numtiles = numtiles
-        self.ul = list(set(ul))
-        return self.ul
+        return self.extend(self.numtiles)
@@ -31,10 +31,11 @@ class RectTiler(BaseTiler):
             
         ul = []
         for r in self.rclab:
-            c = np.uint32(map(np.mean,np.where(self.rcomp==r)))                         
+            c = np.int64(list(map(np.mean,np.where(self.rcomp==r))))
             # get center tile
             cul = (c[0]-t2,c[1]-t2)
-            ul.append(cul)
+            if cul not in self.exclude:
+                ul.append(cul)
             if len(self.maskskip)!=0:
                 tmask = extract_tile(self.maskskip,cul,self.tiledim)
                 if tmask.any():
@@ -45,6 +46,8 @@ class RectTiler(BaseTiler):
             for ti in toff:
                 for tj in toff:
                     tul = (cul[0]+ti,cul[1]+tj)
+                    if tul in self.exclude:
+                        continue
                     if len(self.maskskip)!=0:
                         tmask = extract_tile(self.maskskip,tul,self.tiledim)
                         if tmask.any():
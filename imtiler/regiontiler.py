@@ -4,6 +4,7 @@ from .util import *
 from .basetiler import *
 from .masktiler import *
 from .coveragetiler import *
+from .weightedtiler import *
 
 class RegionTiler(BaseTiler):
     """
@@ -11,14 +12,17 @@ class RegionTiler(BaseTiler):
 
     Summary: tiler class for labeled connected components images.
     Generates tiles for each nonzero connected component in the rcomp image
-    using either the MaskTiler or CoverageTiler class. 
+    using the MaskTiler, CoverageTiler or WeightedTiler class. 
 
     Arguments:
     - rcomp: rcomp image, 2D integer-labeled connected component image
     - tiledim: tile dimension
 
     Keyword Arguments:
-    None
+    - mode: 'coverage' (CoverageTiler), 'mask' (MaskTiler) or 'weighted'
+            (WeightedTiler)
+    - weights: per-pixel weight map for mode='weighted' (default None =
+               uniform weights over each component)
 
     Output:
     None
@@ -28,7 +32,13 @@ class RegionTiler(BaseTiler):
         self.rcomp    = rcomp
         self.rclab    = kwargs.pop('rclab',np.unique(rcomp[rcomp!=0]))
         self.tilemode = kwargs.pop('mode','coverage')
-        self.tiler    = CoverageTiler if self.tilemode=='coverage' else MaskTiler
+        self.weights  = kwargs.pop('weights',None)
+        if self.tilemode=='coverage':
+            self.tiler = CoverageTiler
+        elif self.tilemode=='weighted':
+            self.tiler = WeightedTiler
+        else:
+            self.tiler = MaskTiler
         self.tilerkw  = kwargs
         
     def collect(self):
@@ -38,7 +48,10 @@ class RegionTiler(BaseTiler):
         ul = []
         for r in self.rclab:
             tilerkw = (self.tilerkw).copy()
-            tiler = self.tiler((self.rcomp==r),self.tiledim,**tilerkw)
+            rmask = (self.rcomp==r)
+            if self.tilemode=='weighted' and self.weights is not None:
+                rmask = self.weights*rmask
+            tiler = self.tiler(rmask,self.tiledim,**tilerkw)
             ul.extend(tiler.collect())
         self.ul = ul
         
@@ -0,0 +1,168 @@
+from __future__ import absolute_import, print_function, division
+
+from .util import *
+from .basetiler import *
+from .masktiler import *
+from .coveragetiler import *
+
+class StripeTiler(BaseTiler):
+    """
+    StripeTiler(mask,tiledim,**kwargs)
+
+    Summary: streaming tiler for images taller than memory. Processes the
+    mask in horizontal stripes of stripedim rows (plus a one-tile halo) using
+    either the MaskTiler or CoverageTiler class, sampling tiles whose
+    upper-left row falls in the current stripe. Only the tiles overlapping
+    the next stripe are carried across stripe boundaries, so peak memory is
+    O((stripedim+tiledim) x ncols) regardless of image height.
+
+    Arguments:
+    - mask: [nrows x ncols] bool mask indicating valid regions to sample,
+            any array supporting row slicing (e.g., np.memmap, 
+            np.load(maskf,mmap_mode='r'), h5py dataset)
+    - tiledim: tile dimension
+
+    Keyword Arguments:
+    - numtiles: total number of tiles, allocated to stripes in proportion 
+                to their number of valid pixels
+    - stripedim: stripe height in rows (default 8*tiledim)
+    - mode: 'mask' (MaskTiler) or 'coverage' (CoverageTiler) 
+    remaining keyword arguments are passed to the per-stripe tiler
+
+    Stripe samplers are seeded from random_state and the stripe index, so
+    checkpoints (collect/save with checkpoint=statef) record the completed
+    stripes and the tiles carried into the next one, and an interrupted run
+    resumes at the first unfinished stripe after load_state(statef).
+
+    Output:
+    None
+    """    
+    def __init__(self,mask,tiledim,**kwargs):
+        super(StripeTiler,self).__init__(tiledim,**kwargs)
+        kwargs.pop('random_state',None)
+        pop_exclude(kwargs) # shifted into stripe coords in iterstripes
+        self.mask      = mask
+        self.numtiles  = kwargs.pop('numtiles',MIN_TILES)
+        self.stripedim = max(tiledim,kwargs.pop('stripedim',8*tiledim))
+        self.tilemode  = kwargs.pop('mode','mask')
+        self.tiler     = CoverageTiler if self.tilemode=='coverage' else MaskTiler
+        self.tilerkw   = kwargs
+
+        nrows,ncols = mask.shape[0],mask.shape[1]
+        if nrows<=tiledim or ncols<=tiledim:
+            msg='tiledim %d too large for shape (%d x %d)'%(tiledim,nrows,ncols)
+            raise Exception(msg)
+        self.nrows = nrows
+        self.ncols = ncols
+
+        # [start,stop) upper-left rows of each stripe (tiles need i+tiledim<nrows)
+        self.stripes = [(r0,min(r0+self.stripedim,nrows-tiledim))
+                        for r0 in range(0,nrows-tiledim,self.stripedim)]
+
+        # allocate numtiles to stripes by the number of valid, non-excluded
+        # upper-left pixels (one pass over mask)
+        counts = np.float64([np.count_nonzero((np.asarray(mask[r0:r1])!=0) &
+                                              (self.exclude.shifted(r0,0).tomask(
+                                                  [r1-r0,ncols])==0))
+                             for r0,r1 in self.stripes])
+        cumtiles = np.round(np.cumsum(counts)*self.numtiles/max(counts.sum(),1))
+        self.stripetiles = np.int64(np.diff(np.r_[0,cumtiles]))
+        self.stripe = 0 # index of the next stripe to sample
+        self.carry  = [] # tiles overlapping the next stripe
+
+    def get_state(self):
+        state = super(StripeTiler,self).get_state()
+        state.update(stripe=np.int64(self.stripe),
+                     carry=np.int64(self.carry).reshape([-1,2]),
+                     stripetiles=self.stripetiles,
+                     shape=np.int64([self.nrows,self.ncols]))
+        return state
+
+    def set_state(self,state):
+        if tuple(state['shape']) != (self.nrows,self.ncols) or \
+           not np.array_equal(state['stripetiles'],self.stripetiles):
+            msg = 'checkpoint stripes do not match mask shape %s, stripedim %d'
+            raise Exception(msg%(str((self.nrows,self.ncols)),self.stripedim))
+        super(StripeTiler,self).set_state(state)
+        self.stripe = int(state['stripe'])
+        self.carry  = array2coords(state['carry'])
+
+    def iterstripes(self, **kwargs):
+        """
+        iterstripes(self, checkpoint=None)
+
+        generator yielding the list of upper-left coords sampled in each 
+        stripe, starting at the first unfinished stripe of a restored state
+        (or the first stripe once all stripes are finished); checkpoint = 
+        state file updated after each stripe
+        """
+        checkpoint = kwargs.pop('checkpoint',None)
+        if self.stripe==0 or self.stripe>=len(self.stripes):
+            self.stripe,self.carry,self.ul = 0,[],[]
+        for k in range(self.stripe,len(self.stripes)):
+            r0,r1 = self.stripes[k]
+            sul = self._sample_stripe(k)
+            # carry tiles overlapping the next stripe
+            self.carry = [ul for ul in sul if ul[0]+self.tiledim>r1]
+            self.ul.extend(sul)
+            self.stripe = k+1
+            yield sul
+            # checkpoint once the caller is done with the stripe (e.g., saved)
+            if checkpoint:
+                self.save_state(checkpoint)
+
+    def _sample_stripe(self, k):
+        # returns the sorted upper-left coords sampled in stripe k
+        r0,r1 = self.stripes[k]
+        ntiles = self.stripetiles[k]
+        if ntiles==0:
+            return []
+
+        # one-tile halo below the stripe covers tiles with ul in [r0,r1)
+        smask = np.asarray(self.mask[r0:min(self.nrows,r1+self.tiledim)])
+        tilerkw = (self.tilerkw).copy()
+        tilerkw.update(numtiles=ntiles,random_state=self.rndstate+k,
+                       exclude_coords=self.exclude.shifted(r0,0))
+        tiler = self.tiler(smask,self.tiledim,**tilerkw)
+        tiler.mark_seen([(i-r0,j) for i,j in self.carry])
+        return sorted([(i+r0,j) for i,j in tiler.collect()])
+
+    def collect(self, **kwargs):
+        """
+        collect(self, checkpoint=None)
+
+        samples all (remaining) stripes, checkpoint = state file updated 
+        after each stripe
+        """
+        if self.ul != [] and self.stripe>=len(self.stripes):
+            return self.ul
+
+        for sul in self.iterstripes(**kwargs):
+            pass
+        print('Collected',len(self.ul),'of',self.numtiles,'requested tiles',
+              'from',len(self.stripes),'stripes')
+        return self.ul
+
+    def iterextract(self, img):
+        """
+        generator yielding the extracted tiles (as a dict) for each stripe,
+        img can be any array supporting slicing (e.g., np.memmap)
+        """
+        for sul in self.iterstripes():
+            yield extract_tiles(img,sul,self.tiledim)
+
+    def save(self, img, outdir, outext, savefunc, **kwargs):
+        # checkpoint = state file updated after each stripe, resumed saves 
+        # keep the tiles of finished stripes
+        checkpoint = kwargs.pop('checkpoint',None)
+        if 0 < self.stripe < len(self.stripes):
+            kwargs['overwrite'] = False
+        outfiles = []
+        for sul in self.iterstripes(checkpoint=checkpoint):
+            if len(sul)==0:
+                continue
+            outfiles.extend(save_tiles(img,sul,self.tiledim,outdir,outext,
+                                       savefunc,**kwargs))
+            # existing files were removed when saving the first stripe
+            kwargs['overwrite'] = False
+        return outfiles
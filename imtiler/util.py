@@ -27,6 +27,174 @@ class ScikitImageSaver:
             warn('File %s exists, skipping'%outf)
         else:
             imsave(outf,outimg.squeeze())
+
+class NumpyLoader:
+    """
+    raw .npy imageloader function class, preserves dtype and band count
+    (mmap_mode='r' memory maps the array instead of reading it)
+    """
+    def __init__(self, mmap_mode=None):
+        self.mmap_mode = mmap_mode
+        
+    def __call__(self, imgf, **kwargs):
+        return np.load(imgf,mmap_mode=kwargs.pop('mmap_mode',self.mmap_mode))
+
+class NumpySaver:
+    """
+    raw .npy imagesaver function class, writes tiles without encoding
+    """
+    def __call__(self, outf, outimg, **kwargs):
+        overwrite = kwargs.pop('overwrite',False)
+        if pathexists(outf) and not overwrite:
+            warn('File %s exists, skipping'%outf)
+        else:
+            with open(outf,'wb') as fid:
+                np.save(fid,outimg)
+
+class PILImageLoader:
+    """
+    dtype-preserving imageloader function class using PIL
+    
+    Keyword Arguments:
+    - draft: scale factor in (0,1] for reduced-resolution JPEG decoding
+             (e.g., 0.25 decodes at 1/4 resolution), ignored for other 
+             formats (default None = full resolution). Draft images are 
+             smaller than the full-resolution image, so only use draft 
+             loaders to compute coarse masks, never to load tiles.
+    """
+    def __init__(self, draft=None):
+        self.draft = draft
+        
+    def __call__(self, imgf, **kwargs):
+        from PIL import Image
+        draft = kwargs.pop('draft',self.draft)
+        img = Image.open(imgf)
+        if draft is not None and img.format == 'JPEG':
+            ncols,nrows = img.size
+            img.draft(img.mode,(int(ncols*draft),int(nrows*draft)))
+        return np.asarray(img)
+
+class PILImageSaver:
+    """
+    PIL imagesaver function class with configurable PNG compression
+    (compress_level=0 writes uncompressed PNGs) and JPEG quality
+    """
+    def __init__(self, compress_level=1, quality=90):
+        self.compress_level = compress_level
+        self.quality = quality
+        
+    def __call__(self, outf, outimg, **kwargs):
+        from PIL import Image
+        overwrite = kwargs.pop('overwrite',False)
+        if pathexists(outf) and not overwrite:
+            warn('File %s exists, skipping'%outf)
+            return
+        if outimg.ndim==3 and outimg.shape[2]==1:
+            outimg = outimg[...,0]
+        try:
+            pilimg = Image.fromarray(outimg)
+        except TypeError:
+            msg = 'PIL cannot save %s tile with shape %s to %s '%(outimg.dtype,
+                                                                str(outimg.shape),
+                                                                outf)
+            msg += '(load images with PILImageLoader or use the npy codec)'
+            raise Exception(msg)
+        pilimg.save(outf,compress_level=self.compress_level,quality=self.quality)
+
+# codec registry: name -> dict(load=loadfunc,save=savefunc,ext=extension)
+CODECS = {}
+
+def register_codec(name,load,save,ext):
+    """
+    register_codec(name,load,save,ext)
+    
+    Summary: registers an imageloader/imagesaver pair under name
+    
+    Arguments:
+    - name: codec name
+    - load: imageloader function (imgf -> array)
+    - save: imagesaver function (outf,outimg,overwrite=False)
+    - ext: file extension written by save
+    
+    Output:
+    None
+    """
+    CODECS[name] = dict(load=load,save=save,ext=ext)
+
+def get_codec(name):
+    """
+    returns (load,save,ext) for registered codec name
+    """
+    if name not in CODECS:
+        msg = 'unknown codec "%s" (registered: %s)'%(name,', '.join(sorted(CODECS)))
+        raise Exception(msg)
+    codec = CODECS[name]
+    return codec['load'],codec['save'],codec['ext']
+
+register_codec('skimage',ScikitImageLoader(),ScikitImageSaver(),'.png')
+register_codec('npy',NumpyLoader(),NumpySaver(),'.npy')
+register_codec('png0',PILImageLoader(),PILImageSaver(compress_level=0),'.png')
+register_codec('png1',PILImageLoader(),PILImageSaver(compress_level=1),'.png')
+register_codec('jpg',PILImageLoader(),PILImageSaver(quality=90),'.jpg')
+
+def benchmark_codecs(img,codecs=None,ntrials=3,verbose=True):
+    """
+    benchmark_codecs(img,codecs=None,ntrials=3,verbose=True)
+    
+    Summary: micro-benchmark of registered codecs, saves and reloads img 
+    ntrials times with each codec in a temporary directory
+    
+    Arguments:
+    - img: image (tile) array to encode
+    
+    Keyword Arguments:
+    - codecs: list of codec names to benchmark (default None = all registered)
+    - ntrials: number of save/load trials per codec
+    - verbose: print a summary table
+    
+    Output:
+    - dict of (name, dict(ext,nbytes,save_mbps,load_mbps,dtype)) pairs,
+      throughput in MB/s of raw img data, nbytes = encoded file size
+    """
+    import time, shutil, tempfile
+    gettime = time.time
+    
+    codecs = sorted(CODECS) if codecs is None else codecs
+    rawmb = img.nbytes/float(2**20)
+    tmpdir = tempfile.mkdtemp(prefix='imtiler_codecs')
+    results = {}
+    try:
+        for name in codecs:
+            load,save,ext = get_codec(name)
+            outf = pathjoin(tmpdir,name+ext)
+            try:
+                starttime = gettime()
+                for i in range(ntrials):
+                    save(outf,img,overwrite=True)
+                savetime = (gettime()-starttime)/ntrials
+                starttime = gettime()
+                for i in range(ntrials):
+                    limg = load(outf)
+                loadtime = (gettime()-starttime)/ntrials
+            except Exception as e:
+                warn('codec "%s" failed: %s'%(name,str(e)))
+                continue
+            results[name] = dict(ext=ext,nbytes=os.path.getsize(outf),
+                                 save_mbps=rawmb/max(savetime,1e-9),
+                                 load_mbps=rawmb/max(loadtime,1e-9),
+                                 dtype=str(np.asarray(limg).dtype))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if verbose:
+        print('codec ext nbytes save_mbps load_mbps dtype')
+        for name in codecs:
+            if name in results:
+                res = results[name]
+                print('%s %s %d %0.1f %0.1f %s'%(name,res['ext'],res['nbytes'],
+                                               res['save_mbps'],
+                                               res['load_mbps'],res['dtype']))
+    return results
             
 class DefaultMasker:
     """        
@@ -46,7 +214,99 @@ class DefaultMasker:
         if isinstance(img,str) and pathexists(img):
             img = loadfunc(img)
             
-        return np.ones([img.shape[0],img.shape[1]],dtype=np.bool8)
+        return np.ones([img.shape[0],img.shape[1]],dtype=np.bool_)
+
+class FiniteMasker:
+    """
+    Summary: marks pixels with elts that are all finite as valid, computed
+    in chunks of chunkrows rows so multiband images never allocate a full
+    boolean cube
+    
+    Arguments:
+    - img: image array or image file
+    
+    Keyword Arguments:
+    None
+    
+    Output:
+    - boolean mask with the same number of pixels as img
+    """
+    def __init__(self, chunkrows=512):
+        self.chunkrows = chunkrows
+        
+    def __call__(self, img, **kwargs):
+        if isinstance(img,str) and pathexists(img):
+            img = loadfunc(img)
+        nrows,ncols = img.shape[0],img.shape[1]
+        if img.dtype.kind not in 'fc':
+            return np.ones([nrows,ncols],dtype=np.bool_)
+        
+        mask = np.empty([nrows,ncols],dtype=np.bool_)
+        for r0 in range(0,nrows,self.chunkrows):
+            chunk = np.isfinite(img[r0:r0+self.chunkrows])
+            mask[r0:r0+self.chunkrows] = chunk.all(axis=2) if chunk.ndim==3 \
+                                         else chunk
+        return mask
+
+class CachedMasker:
+    """
+    Summary: wraps mask function masker, persisting its masks as bit-packed
+    sidecar files keyed by image path, mtime, size and masker identity, so 
+    later calls for an unchanged image reload the mask instead of
+    recomputing it
+    
+    Arguments:
+    - masker: mask function to wrap, masker.cachekey (if defined) should
+              describe any parameters that change its output (default =
+              masker class name)
+    
+    Keyword Arguments:
+    - cachedir: sidecar directory (default None = alongside each image)
+    
+    Output:
+    None
+    """
+    def __init__(self, masker, cachedir=None):
+        self.masker   = masker
+        self.cachedir = cachedir
+        self.cachekey = getattr(masker,'cachekey',None) or \
+                        '%s.%s'%(masker.__class__.__module__,
+                                 masker.__class__.__name__)
+
+    def sidecar(self, imgf):
+        """
+        returns the sidecar file for image file imgf
+        """
+        import hashlib
+        imgf = abspath(imgf)
+        imgstat = os.stat(imgf)
+        key = '%s|%r|%d|%s'%(imgf,imgstat.st_mtime,imgstat.st_size,self.cachekey)
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        cachedir = self.cachedir or dirname(imgf)
+        return pathjoin(cachedir,'.%s.%s.mask.npz'%(basename(imgf),key))
+        
+    def __call__(self, img, **kwargs):
+        # img is either an image file or an array loaded from file imgf
+        imgf = img if isinstance(img,str) else kwargs.pop('imgf',None)
+        if imgf is None or not pathexists(imgf):
+            return self.masker(img,**kwargs)
+
+        sidecarf = self.sidecar(imgf)
+        if pathexists(sidecarf):
+            with np.load(sidecarf) as cached:
+                ncols = int(cached['shape'][1])
+                return np.unpackbits(cached['bits'],axis=1)[:,:ncols].view(np.bool_)
+
+        mask = self.masker(img,**kwargs)
+        if self.cachedir and not pathexists(self.cachedir):
+            os.makedirs(self.cachedir)
+        # write + rename so concurrent workers never read partial sidecars
+        tmpf = sidecarf+'.%d.tmp'%os.getpid()
+        with open(tmpf,'wb') as fid:
+            np.savez(fid,bits=np.packbits(mask,axis=1),
+                     shape=np.int64(mask.shape))
+        os.rename(tmpf,sidecarf)
+        return mask
 
 loadfunc = ScikitImageLoader()
 savefunc = ScikitImageSaver()
@@ -67,6 +327,140 @@ def timeit(func):
         return res
     return wrapper
 
+def coords2array(coords):
+    """
+    converts a list/set of (row,col) coordinate tuples to a sorted [n x 2] array
+    """
+    return np.int64(sorted(coords)).reshape([-1,2])
+
+def array2coords(coordarr):
+    """
+    converts a [n x 2] coordinate array to a list of (row,col) tuples
+    """
+    return [tuple(ij) for ij in np.asarray(coordarr).reshape([-1,2]).tolist()]
+
+class ExcludeSet:
+    """
+    ExcludeSet(coords=[],rects=[],mask=None,cellsize=256)
+    
+    Summary: set of excluded upper-left tile coords with O(1) membership
+    tests, given as coords (hash set), rectangles (bucketed spatial index) 
+    and/or an exclusion mask
+    
+    Keyword Arguments:
+    - coords: list of (row,col) excluded upper-left coords
+    - rects: list of (row_start,row_stop,col_start,col_stop) regions of
+             excluded upper-left coords
+    - mask: [nrows x ncols] mask of excluded upper-left coords
+    - cellsize: bucket size of the rectangle index
+    
+    Output:
+    None
+    """
+    def __init__(self, coords=[], rects=[], mask=None, cellsize=256):
+        self.coords   = set([])
+        self.rects    = []
+        self.cells    = {}
+        self.mask     = mask
+        self.cellsize = cellsize
+        self.offset   = (0,0)
+        self.update(coords)
+        for rect in rects:
+            self.add_rect(rect)
+
+    def add(self, ij):
+        self.coords.add((int(ij[0]),int(ij[1])))
+
+    def update(self, coords):
+        self.coords.update([(int(ij[0]),int(ij[1])) for ij in coords])
+
+    def add_rect(self, rect):
+        r0,r1,c0,c1 = map(int,rect)
+        self.rects.append((r0,r1,c0,c1))
+        cs = self.cellsize
+        for bi in range(r0//cs,(r1-1)//cs+1):
+            for bj in range(c0//cs,(c1-1)//cs+1):
+                self.cells.setdefault((bi,bj),[]).append(len(self.rects)-1)
+
+    def __contains__(self, ij):
+        i,j = ij[0]+self.offset[0],ij[1]+self.offset[1]
+        if (i,j) in self.coords:
+            return True
+        if self.mask is not None and 0<=i<self.mask.shape[0] and \
+           0<=j<self.mask.shape[1] and self.mask[i,j]:
+            return True
+        for k in self.cells.get((i//self.cellsize,j//self.cellsize),[]):
+            r0,r1,c0,c1 = self.rects[k]
+            if r0<=i<r1 and c0<=j<c1:
+                return True
+        return False
+
+    def copy(self):
+        exclude = ExcludeSet(mask=self.mask,cellsize=self.cellsize)
+        exclude.coords = set(self.coords)
+        exclude.rects  = list(self.rects)
+        exclude.cells  = dict([(k,list(v)) for k,v in self.cells.items()])
+        exclude.offset = self.offset
+        return exclude
+
+    def shifted(self, di, dj):
+        """
+        returns a view of the set in coords offset by (di,dj), e.g., for a
+        tiler working on the subimage with upper-left corner (di,dj)
+        """
+        exclude = ExcludeSet(cellsize=self.cellsize)
+        exclude.coords,exclude.rects = self.coords,self.rects
+        exclude.cells,exclude.mask = self.cells,self.mask
+        exclude.offset = (self.offset[0]+di,self.offset[1]+dj)
+        return exclude
+
+    def tomask(self, shape):
+        """
+        returns [nrows x ncols] uint8 mask of excluded upper-left coords
+        """
+        nrows,ncols = shape[0],shape[1]
+        oi,oj = self.offset
+        out = np.zeros([nrows,ncols],dtype=np.uint8)
+        if len(self.coords)!=0:
+            ij = np.int64(list(self.coords)).reshape([-1,2])-[oi,oj]
+            keep = (ij[:,0]>=0)&(ij[:,0]<nrows)&(ij[:,1]>=0)&(ij[:,1]<ncols)
+            out[ij[keep,0],ij[keep,1]] = 1
+        for r0,r1,c0,c1 in self.rects:
+            out[max(0,r0-oi):max(0,r1-oi),max(0,c0-oj):max(0,c1-oj)] = 1
+        if self.mask is not None:
+            msub = self.mask[max(0,oi):max(0,oi+nrows),max(0,oj):max(0,oj+ncols)]
+            di,dj = max(0,-oi),max(0,-oj)
+            out[di:di+msub.shape[0],dj:dj+msub.shape[1]] |= np.uint8(msub!=0)
+        return out
+
+def pop_exclude(kwargs):
+    """
+    pop_exclude(kwargs)
+    
+    Summary: pops the exclusion keyword arguments shared by all tilers
+    
+    Arguments:
+    - kwargs: tiler keyword arguments
+    
+    Output:
+    - ExcludeSet combining exclude_coords (list of coords or ExcludeSet),
+      exclude_rects and exclude_mask
+    """
+    coords = kwargs.pop('exclude_coords',[])
+    rects  = kwargs.pop('exclude_rects',[])
+    mask   = kwargs.pop('exclude_mask',None)
+    if isinstance(coords,ExcludeSet):
+        if len(rects)==0 and mask is None:
+            return coords
+        exclude = coords.copy()
+    else:
+        exclude = ExcludeSet(coords=coords)
+    for rect in rects:
+        exclude.add_rect(rect)
+    if mask is not None:
+        exclude.mask = mask if exclude.mask is None else (exclude.mask!=0)|(mask!=0)
+    return exclude
+
 def tile2str(tileslice):
     """
     converts 3d tile slice ((row_start,row_stop,None),(col_start,col_stop,None)) to
@@ -74,16 +468,198 @@ def tile2str(tileslice):
     """
     return ' '.join(['%d %d'%(si.start,si.stop) for si in tileslice])
 
-def summarize_tiles(ul_list,tdim):
-    tileinfof = 'tileinfo.txt'
-    tileinfohdr = 'tileid,row_start,row_stop,col_start,col_stop'
+def summarize_tiles(ul_list,tdim,tileinfof='tileinfo.txt',**kwargs):
+    """
+    summarize_tiles(ul_list,tdim,tileinfof='tileinfo.txt',**kwargs)
+    
+    Summary: writes tile extents to text file tileinfof
+    
+    Arguments:
+    - ul_list: list of upper-left tile coords
+    - tdim: tile dimension
+    
+    Keyword Arguments:
+    - tileinfof: output file (default 'tileinfo.txt')
+    - image: image name (or list of names, one per tile), written as the 
+             first column (default None)
+    - tileids: tile ids for each ul (default None = range(len(ul_list)))
+    
+    Output:
+    None
+    """
+    image = kwargs.pop('image',None)
+    tileids = kwargs.pop('tileids',None)
+    if tileids is None:
+        tileids = range(len(ul_list))
+    tileinfohdr = 'tileid row_start row_stop col_start col_stop'
+    if image is not None:
+        tileinfohdr = 'image '+tileinfohdr
+        if isinstance(image,str):
+            image = [image]*len(ul_list)
     tstr = [tileinfohdr]
-    for i,ul in enuemerate(ul_list):
-        tstr.append(' '.join(map(str,(i,ul[0],ul[0]+tdim,ul[1],ul[1]+tdim))))
+    for k,(i,ul) in enumerate(zip(tileids,ul_list)):
+        tinfo = (i,ul[0],ul[0]+tdim,ul[1],ul[1]+tdim)
+        if image is not None:
+            tinfo = (image[k],)+tinfo
+        tstr.append(' '.join(map(str,tinfo)))
     tstr = '\n'.join(tstr)
     with open(tileinfof,'w') as fid:
         print(tstr,file=fid)
 
+def merge_tileinfo(tileinfofs,outf,**kwargs):
+    """
+    merge_tileinfo(tileinfofs,outf,**kwargs)
+    
+    Summary: merges tileinfo files written by summarize_tiles (e.g., one per
+    shard) into outf, sorted by (image,) tileid so the output does not 
+    depend on how tiles were split between the input files
+    
+    Arguments:
+    - tileinfofs: list of tileinfo files of one run
+    - outf: output file
+    
+    Keyword Arguments:
+    - base: tileinfo file of earlier runs (e.g., outf), its rows are kept 
+            for images not listed in tileinfofs (all its rows are replaced
+            for tileinfo files without an image column) (default None)
+    
+    Output:
+    None
+    """
+    base = kwargs.pop('base',None)
+    tileinfohdr,rows = None,[]
+    for tileinfof in tileinfofs:
+        with open(tileinfof,'r') as fid:
+            tileinfohdr = fid.readline().strip()
+            rows.extend([line.split() for line in fid if line.strip()])
+    if tileinfohdr is None:
+        return
+    hasimage = tileinfohdr.startswith('image')
+    if base is not None and pathexists(base):
+        images = set([row[0] for row in rows])
+        with open(base,'r') as fid:
+            if fid.readline().strip()==tileinfohdr and hasimage:
+                rows.extend([line.split() for line in fid
+                             if line.strip() and line.split()[0] not in images])
+    if hasimage:
+        rows.sort(key=lambda row: (row[0],int(row[1])))
+    else:
+        rows.sort(key=lambda row: int(row[0]))
+    with open(outf,'w') as fid:
+        print('\n'.join([tileinfohdr]+[' '.join(row) for row in rows]),file=fid)
+
+def stable_hash(key):
+    """
+    returns a process- and platform-independent integer hash of string key
+    """
+    import hashlib
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest(),16)
+
+def shard_of(key,shard_count):
+    """
+    returns the shard index in [0,shard_count) assigned to string key
+    (e.g., an image name) by stable hash
+    """
+    return stable_hash(key)%shard_count
+
+def shard_range(n,shard_index,shard_count):
+    """
+    returns [start,stop) of the contiguous range of n items (e.g., tile
+    indices within an image) assigned to shard shard_index
+    """
+    return (n*shard_index)//shard_count,(n*(shard_index+1))//shard_count
+
+def iter_atlas(tiles,ncols,nrows,chunkrows=1,fill=0):
+    """
+    iter_atlas(tiles,ncols,nrows,chunkrows=1,fill=0)
+    
+    Summary: generator yielding (row_start, atlas_chunk) pairs, where each
+    atlas_chunk packs chunkrows atlas rows of the [N x th x tw x b] tile
+    stack with a single reshape/transpose, empty cells are set to fill
+    """
+    ntiles,th,tw,nb = tiles.shape
+    for r0 in range(0,nrows,chunkrows):
+        r1 = min(nrows,r0+chunkrows)
+        ncell = (r1-r0)*ncols
+        chunk = np.asarray(tiles[r0*ncols:min(ntiles,r1*ncols)])
+        if len(chunk) < ncell:
+            empty = np.full([ncell-len(chunk),th,tw,nb],fill,dtype=tiles.dtype)
+            chunk = np.concatenate([chunk,empty],axis=0)
+        chunk = chunk.reshape([r1-r0,ncols,th,tw,nb]).transpose(0,2,1,3,4)
+        yield r0*th, chunk.reshape([(r1-r0)*th,ncols*tw,nb])
+
+def tile_atlas(tiles,ncols=None,nrows=None,**kwargs):
+    """
+    tile_atlas(tiles,ncols=None,nrows=None,**kwargs)
+    
+    Summary: packs a tile stack into a [nrows*th x ncols*tw x b] atlas
+    (contact sheet) in row-major order
+    
+    Arguments:
+    - tiles: [N x th x tw x b] tile stack (or [N x th x tw]), any array
+             supporting slicing along axis 0 (e.g., np.memmap), or a dict of
+             (ul, tile) pairs (e.g., extract_tiles output)
+    
+    Keyword Arguments:
+    - ncols: number of atlas columns (default ceil(sqrt(N)))
+    - nrows: number of atlas rows (default ceil(N/ncols))
+    - fill: value for empty cells (default 0)
+    - outf: stream the atlas to .npy file outf in chunks of chunkrows atlas
+            rows, for atlases too large for memory (default None)
+    - chunkrows: atlas rows per chunk when outf is given (default 1)
+    - indexf: write the coordinate index to text file indexf (default None)
+    
+    Output:
+    - atlas: atlas array (memmap when outf is given)
+    - index: [N x 3] array of (tileid, row_start, col_start) atlas coords,
+             [N x 5] with (ul_row, ul_col) columns appended for dict input
+    """
+    fill      = kwargs.pop('fill',0)
+    outf      = kwargs.pop('outf',None)
+    chunkrows = kwargs.pop('chunkrows',1)
+    indexf    = kwargs.pop('indexf',None)
+
+    ul_list = None
+    if isinstance(tiles,dict):
+        ul_list = sorted(tiles.keys())
+        tiles = np.stack([tiles[ul] for ul in ul_list],axis=0)
+    if tiles.ndim==3:
+        tiles = tiles[...,None]
+    ntiles,th,tw,nb = tiles.shape
+    
+    if ncols is None:
+        ncols = int(np.ceil(np.sqrt(ntiles))) if nrows is None \
+                else int(np.ceil(ntiles/float(nrows)))
+    if nrows is None:
+        nrows = int(np.ceil(ntiles/float(ncols)))
+    if nrows*ncols < ntiles:
+        msg = '%d tiles do not fit in (%d x %d) atlas'%(ntiles,nrows,ncols)
+        raise Exception(msg)
+
+    tileid = np.arange(ntiles)
+    index = np.c_[tileid,(tileid//ncols)*th,(tileid%ncols)*tw]
+    if ul_list is not None:
+        index = np.c_[index,np.int64(ul_list).reshape([-1,2])]
+
+    atlasshape = [nrows*th,ncols*tw,nb]
+    if outf is None:
+        # single reshape/transpose over the whole stack
+        atlas = next(iter_atlas(tiles,ncols,nrows,chunkrows=nrows,fill=fill))[1]
+    else:
+        atlas = np.lib.format.open_memmap(outf,mode='w+',dtype=tiles.dtype,
+                                          shape=tuple(atlasshape))
+        for row_start,chunk in iter_atlas(tiles,ncols,nrows,chunkrows,fill):
+            atlas[row_start:row_start+chunk.shape[0]] = chunk
+        atlas.flush()
+
+    if indexf is not None:
+        hdr = 'tileid row_start col_start'
+        if ul_list is not None:
+            hdr += ' ul_row ul_col'
+        np.savetxt(indexf,index,fmt='%d',header=hdr,comments='')
+        
+    return atlas, index
+
 def bands2grid(img,gb,orientation='columnwise'):
     """
     bands2grid(img,gb,orientation='columnwise')
@@ -117,17 +693,53 @@ def bands2grid(img,gb,orientation='columnwise'):
         gsq = int(gsq)
         gr,gc = gsq,gsq
 
-    def gridslice(gidx):
-        # return the whole image by default
-        gri,gci = int(gidx/gc),gidx%gc
-        sl = (slice(gri*nr,(gri+1)*nr,None),
-              slice(gci*nc,(gci+1)*nc,None))
-        return sl
-            
-    gimg = np.zeros([gr*nr,gc*nc,gb],dtype=img.dtype)
-    for gi in range(gcell):
-        gimg[gridslice(gi)] = img[...,gi:gi+gb]
-    return gimg
+    # cell gi holds bands [gi*gb,(gi+1)*gb)
+    cells = img.reshape([nr,nc,gcell,gb]).transpose(2,0,1,3)
+    return tile_atlas(cells,ncols=gc,nrows=gr)[0]
+
+def boxsum(img,bdim):
+    """
+    boxsum(img,bdim)
+    
+    Summary: sums 2D img over every bdim x bdim box using an integral image
+    
+    Arguments:
+    - img: [nrows x ncols] image
+    - bdim: box dimension
+    
+    Output:
+    - [nrows-bdim+1 x ncols-bdim+1] array, element (i,j) = sum of the box with
+      upper-left coordinate (i,j)
+    """
+    img = np.asarray(img)
+    dtype = np.float64 if img.dtype.kind in 'fc' else np.int64
+    nr,nc = img.shape[0],img.shape[1]
+    csum = np.zeros([nr+1,nc+1],dtype=dtype)
+    np.cumsum(img,axis=0,dtype=dtype,out=csum[1:,1:])
+    np.cumsum(csum[1:,1:],axis=1,out=csum[1:,1:])
+    return csum[bdim:,bdim:]-csum[:-bdim,bdim:]-csum[bdim:,:-bdim]+csum[:-bdim,:-bdim]
+
+def footprint_free(mask,tdim,margin=0):
+    """
+    footprint_free(mask,tdim,margin=0)
+    
+    Summary: finds upper-left positions whose tdim x tdim tile footprint
+    (grown by margin pixels on each side) contains no nonzero mask pixels
+    
+    Arguments:
+    - mask: [nrows x ncols] mask of pixels to avoid
+    - tdim: tile dimension
+    
+    Keyword Arguments:
+    - margin: min distance in pixels between tile footprints and mask pixels
+    
+    Output:
+    - [nrows-tdim+1 x ncols-tdim+1] bool map of valid upper-left positions
+    """
+    mask = np.asarray(mask)!=0
+    if margin > 0:
+        mask = np.pad(mask,margin,mode='constant')
+    return boxsum(mask,tdim+2*margin)==0
 
 def disk(radius):
     from skimage.morphology import disk as _disk
@@ -150,36 +762,117 @@ def blockpermute(a,blen=25):
     a[bmax:] = randperm(a[bmax:])
     return a
 
-def extract_tile(img,ul,tdim,verbose=False):
+def tile_slices(ul,tdim,nr,nc):
     '''
-    extract a tile of dims (tdim,tdim,img.shape[2]) offset from upper-left 
-    coordinate ul in img, zero pads when tile overlaps image extent 
+    returns ((tile_rows,tile_cols),(img_rows,img_cols)) slices copying the
+    part of the tdim x tdim tile with upper-left coord ul that falls within
+    an nr x nc image extent
     '''
-    assert(img.ndim==3)
-    nr,nc,nb = img.shape
-    
     lr = (ul[0]+tdim,ul[1]+tdim)
     padt,padb = abs(max(0,-ul[0])), tdim-max(0,lr[0]-nr)
     padl,padr = abs(max(0,-ul[1])), tdim-max(0,lr[1]-nc)
     
     ibeg,iend = max(0,ul[0]),min(nr,lr[0])
     jbeg,jend = max(0,ul[1]),min(nc,lr[1])
+    return ((slice(padt,padb),slice(padl,padr)),
+            (slice(ibeg,iend),slice(jbeg,jend)))
+
+def extract_tile(img,ul,tdim,verbose=False):
+    '''
+    extract a tile of dims (tdim,tdim,img.shape[2]) offset from upper-left 
+    coordinate ul in img, zero pads when tile overlaps image extent 
+    '''
+    assert(img.ndim==3)
+    nr,nc,nb = img.shape
+    tsl,isl = tile_slices(ul,tdim,nr,nc)
 
     if verbose:
         print(ul,nr,nc)
-        print(padt,padb,padl,padr)
-        print(ibeg,iend,jbeg,jend)
+        print(tsl)
+        print(isl)
 
     imgtile = np.zeros([tdim,tdim,nb],dtype=img.dtype)
-    imgtile[padt:padb,padl:padr] = img[ibeg:iend,jbeg:jend]
+    imgtile[tsl] = img[isl]
     return imgtile
 
 @timeit
-def extract_tiles(img,ul_list,tdim):
-    tiledict = {}
-    for ul in ul_list:
-        tiledict[ul] = extract_tile(img,ul,tdim)
-    return tiledict
+def extract_tiles(img,ul_list,tdim,**kwargs):
+    """
+    extract_tiles(img,ul_list,tdim,**kwargs)
+    
+    Summary: extracts tiles with upper-left coords in ul_list from img
+    
+    Arguments:
+    - img: [nrows x ncols x nbands] image
+    - ul_list: list of upper-left tile coords
+    - tdim: tile dimension
+    
+    Keyword Arguments:
+    - stats: also return per-tile statistics (default False)
+    - statmask: [nrows x ncols] validity mask for statistics (default None =
+                finite pixels)
+    - bins: histogram bin edges for per-tile statistics (default None)
+    - runstats: RunningStats updated with the valid pixels of the extracted
+                tiles (default None)
+    
+    Output:
+    - dict of (ul, tile) pairs, and dict of (ul, stats record) pairs (see
+      stats_records) if stats=True
+    """
+    stats = kwargs.pop('stats',False)
+    statmask = kwargs.pop('statmask',None)
+    bins = kwargs.pop('bins',None)
+    runstats = kwargs.pop('runstats',None)
+
+    ul_list = list(ul_list)
+    stacks = coextract_tiles([img]+([] if statmask is None else [statmask]),
+                             ul_list,tdim)
+    tstack = stacks[0]
+    valid = None if statmask is None else stacks[1][...,0]!=0
+    if runstats is not None:
+        runstats.update(tstack,valid)
+    tiledict = dict(zip(ul_list,tstack))
+    if not stats:
+        return tiledict
+    tstats = stats_records(tile_stack_stats(tstack,valid,bins))
+    return tiledict, dict(zip(ul_list,tstats))
+
+@timeit
+def coextract_tiles(arrays,ul_list,tdim):
+    """
+    coextract_tiles(arrays,ul_list,tdim)
+    
+    Summary: extracts aligned tiles from several co-registered arrays (e.g.,
+    image, class mask and validity mask) in one pass over ul_list
+    
+    Arguments:
+    - arrays: dict or list of [nrows x ncols x nbands] or [nrows x ncols]
+              arrays with the same nrows and ncols (dtypes and band counts
+              may differ)
+    - ul_list: list of upper-left tile coords
+    - tdim: tile dimension
+    
+    Output:
+    - dict or list of [len(ul_list) x tdim x tdim x nbands] tile stacks,
+      stack[k] = zero padded tile at ul_list[k]
+    """
+    isdict = isinstance(arrays,dict)
+    names = list(arrays.keys()) if isdict else list(range(len(arrays)))
+    arrays = [np.atleast_3d(arrays[name]) for name in names]
+    nr,nc = arrays[0].shape[:2]
+    for name,arr in zip(names,arrays):
+        if arr.shape[:2] != (nr,nc):
+            msg = 'array %s shape %s does not match (%d x %d)'
+            raise Exception(msg%(str(name),str(arr.shape[:2]),nr,nc))
+
+    ntiles = len(ul_list)
+    stacks = [np.zeros([ntiles,tdim,tdim,arr.shape[2]],dtype=arr.dtype)
+              for arr in arrays]
+    for k,ul in enumerate(ul_list):
+        tsl,isl = tile_slices(ul,tdim,nr,nc)
+        for arr,stack in zip(arrays,stacks):
+            stack[(k,)+tsl] = arr[isl]
+    return dict(zip(names,stacks)) if isdict else stacks
 
 @timeit
 def save_tiles_dict(img,ul_dict,tdim,outdir,outext,savefunc,**kwargs):    
@@ -192,8 +885,300 @@ def save_tiles_dict(img,ul_dict,tdim,outdir,outext,savefunc,**kwargs):
     
     return outf
 
+MANIFEST_FILE = 'manifest.txt'
+MANIFEST_FIELDS = ['row','col','file','hash','min','max','mean','std',
+                   'valid','hist']
+
+def read_manifest(manifestf):
+    """
+    read_manifest(manifestf)
+    
+    Summary: reads a tab-delimited tile manifest written by write_manifest
+    
+    Arguments:
+    - manifestf: manifest file
+    
+    Output:
+    - dict of ((row,col), record) pairs, record = dict of (field, str) pairs
+      (empty dict if manifestf does not exist)
+    """
+    manifest = {}
+    if not pathexists(manifestf):
+        return manifest
+    with open(manifestf,'r') as fid:
+        fields = fid.readline().rstrip('\n').split('\t')
+        for line in fid:
+            rec = dict(zip(fields,line.rstrip('\n').split('\t')))
+            manifest[(int(rec['row']),int(rec['col']))] = rec
+    return manifest
+
+def write_manifest(manifestf,manifest):
+    """
+    writes dict of ((row,col), record) pairs to tab-delimited manifestf
+    """
+    lines = ['\t'.join(MANIFEST_FIELDS)]
+    for ul in sorted(manifest.keys()):
+        rec = manifest[ul]
+        rec['row'],rec['col'] = ul
+        lines.append('\t'.join([str(rec.get(field,'')) 
+                                for field in MANIFEST_FIELDS]))
+    with open(manifestf,'w') as fid:
+        print('\n'.join(lines),file=fid)
+
+def merge_manifests(manifestfs,outf):
+    """
+    merges tile manifests (e.g., one per shard) into manifest outf
+    """
+    manifest = {}
+    for manifestf in manifestfs:
+        manifest.update(read_manifest(manifestf))
+    write_manifest(outf,manifest)
+    return manifest
+
+def tile_hash(timg):
+    """
+    returns sha1 hex digest of tile timg contents (including shape + dtype)
+    """
+    import hashlib
+    sha = hashlib.sha1(('%s%s'%(timg.dtype.str,timg.shape)).encode())
+    sha.update(np.ascontiguousarray(timg).data)
+    return sha.hexdigest()
+
+# max number of stack values per chunk in tile_stack_stats/RunningStats
+STATS_CHUNKSIZE = 2**22
+
+def tile_stack_stats(stack,valid=None,bins=None,chunksize=STATS_CHUNKSIZE):
+    """
+    tile_stack_stats(stack,valid=None,bins=None,chunksize=STATS_CHUNKSIZE)
+    
+    Summary: computes per-tile statistics over the valid pixels (all bands)
+    of a tile stack with masked reductions over chunks of tiles, one band at
+    a time, so temporaries are bounded by chunksize regardless of stack size
+    
+    Arguments:
+    - stack: [ntiles x tdim x tdim x nbands] tile stack
+    
+    Keyword Arguments:
+    - valid: [ntiles x tdim x tdim] validity mask, combined with pixels
+             finite in all bands (default None = finite pixels)
+    - bins: histogram bin edges (default None = no histograms)
+    - chunksize: max number of stack values per chunk of tiles
+    
+    Output:
+    - dict of min/max/mean/std/valid (valid pixel fraction) [ntiles] arrays,
+      and hist [ntiles x nbins] counts if bins is not None
+    """
+    ntiles,nbands = stack.shape[0],stack.shape[-1]
+    npix = int(np.prod(stack.shape[1:-1]))
+    x = stack.reshape(ntiles,npix,nbands)
+    if x.dtype==np.bool_:
+        x = x.view(np.uint8)
+    isfloat = np.issubdtype(x.dtype,np.inexact)
+    lo,hi = (-np.inf,np.inf) if isfloat else (np.iinfo(x.dtype).min,
+                                              np.iinfo(x.dtype).max)
+    
+    tstats = dict([(k,np.full(ntiles,np.nan)) for k in ('min','max','mean',
+                                                        'std','valid')])
+    if bins is not None:
+        bins = np.asarray(bins,dtype=np.float64)
+        nbins = len(bins)-1
+        tstats['hist'] = np.zeros([ntiles,nbins],dtype=np.int64)
+    
+    step = max(1,chunksize//max(1,npix*nbands))
+    for t0 in range(0,ntiles,step):
+        xc = x[t0:t0+step]
+        nc = xc.shape[0]
+        vc = np.ones([nc,npix],dtype=bool)
+        if valid is not None:
+            vc = valid[t0:t0+step].reshape(nc,npix)!=0
+        if isfloat:
+            vc &= np.isfinite(xc).all(axis=2)
+        count = vc.sum(axis=1)*nbands
+        
+        vsum = np.zeros(nc)
+        for b in range(nbands):
+            vsum += np.sum(xc[...,b],axis=1,where=vc,dtype=np.float64)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            mean = vsum/count
+        vmin,vmax,vss = np.full(nc,hi),np.full(nc,lo),np.zeros(nc)
+        for b in range(nbands):
+            xb = xc[...,b]
+            vmin = np.minimum(vmin,np.min(xb,axis=1,where=vc,initial=hi))
+            vmax = np.maximum(vmax,np.max(xb,axis=1,where=vc,initial=lo))
+            dev = np.subtract(xb,mean[:,None],dtype=np.float64)
+            vss += np.sum(np.square(dev,out=dev),axis=1,where=vc)
+            if bins is not None:
+                # bin index per pixel, offset by tile so one bincount covers
+                # the chunk
+                bidx = np.searchsorted(bins,xb,side='right')-1
+                bidx[xb==bins[-1]] = nbins-1
+                keep = vc & (bidx>=0) & (bidx<nbins)
+                bidx += np.arange(nc).reshape(-1,1)*nbins
+                tstats['hist'][t0:t0+nc] += np.bincount(
+                    bidx[keep],minlength=nc*nbins).reshape(nc,nbins)
+                
+        with np.errstate(invalid='ignore',divide='ignore'):
+            tstats['std'][t0:t0+nc] = np.sqrt(vss/count)
+        tstats['mean'][t0:t0+nc] = mean
+        tstats['min'][t0:t0+nc] = np.where(count!=0,vmin,np.nan)
+        tstats['max'][t0:t0+nc] = np.where(count!=0,vmax,np.nan)
+        tstats['valid'][t0:t0+nc] = vc.mean(axis=1)
+    return tstats
+
+def stats_records(tstats):
+    """
+    formats tile_stack_stats output as a list of per-tile manifest records
+    (dicts of (field, str) pairs)
+    """
+    ntiles = len(tstats['mean'])
+    recs = [dict([(k,'%.6g'%tstats[k][i]) for k in ('min','max','mean','std')])
+            for i in range(ntiles)]
+    for i,rec in enumerate(recs):
+        rec['valid'] = '%.4f'%tstats['valid'][i]
+        if 'hist' in tstats:
+            rec['hist'] = ','.join(map(str,tstats['hist'][i]))
+    return recs
+
+class RunningStats(object):
+    """
+    RunningStats(bins=None)
+    
+    Summary: running per-band count/mean/std/min/max (and optional histogram
+    over all bands) of the valid pixels in a dataset, updated batch by batch
+    with Welford/Chan merges so images (or shards) can be aggregated without
+    keeping their tiles in memory
+    
+    Keyword Arguments:
+    - bins: histogram bin edges (default None = no histogram)
+    """
+    def __init__(self,bins=None):
+        self.bins = None if bins is None else np.asarray(bins,dtype=np.float64)
+        self.count = 0
+        self.mean = self.m2 = self.min = self.max = None
+        self.hist = None
+
+    def _merge(self,count,mean,m2,bmin,bmax,hist):
+        if count==0:
+            return self
+        if self.count==0:
+            self.count,self.mean,self.m2 = count,mean.copy(),m2.copy()
+            self.min,self.max = bmin.copy(),bmax.copy()
+            self.hist = None if hist is None else hist.copy()
+            return self
+        total = self.count+count
+        delta = mean-self.mean
+        self.mean = self.mean+delta*(count/total)
+        self.m2 = self.m2+m2+(delta*delta)*(self.count*count/total)
+        self.min = np.minimum(self.min,bmin)
+        self.max = np.maximum(self.max,bmax)
+        if hist is not None:
+            self.hist = hist.copy() if self.hist is None else self.hist+hist
+        self.count = total
+        return self
+
+    def update(self,stack,valid=None,chunksize=STATS_CHUNKSIZE):
+        """
+        adds the valid pixels of stack ([... x nbands] array, e.g., a tile
+        stack or image) to the aggregates in chunks of at most chunksize 
+        values, valid = [...] mask combined with pixels finite in all bands
+        (default None = finite pixels)
+        """
+        nbands = stack.shape[-1]
+        x = stack.reshape(-1,nbands)
+        valid = None if valid is None else valid.reshape(-1)
+        step = max(1,chunksize//nbands)
+        for p0 in range(0,x.shape[0],step):
+            xc = x[p0:p0+step]
+            finite = np.isfinite(xc).all(axis=1)
+            if valid is not None:
+                finite &= valid[p0:p0+step]!=0
+            xc = xc[finite].astype(np.float64)
+            if xc.shape[0]==0:
+                continue
+            mean = xc.mean(axis=0)
+            dev = xc-mean
+            hist = None
+            if self.bins is not None:
+                hist = np.histogram(xc,bins=self.bins)[0]
+            self._merge(xc.shape[0],mean,(dev*dev).sum(axis=0),
+                        xc.min(axis=0),xc.max(axis=0),hist)
+        return self
+
+    def merge(self,other):
+        """
+        merges the aggregates of RunningStats other (e.g., another shard)
+        """
+        return self._merge(other.count,other.mean,other.m2,other.min,
+                           other.max,other.hist)
+
+    @property
+    def std(self):
+        return None if self.count==0 else np.sqrt(self.m2/self.count)
+
+    def save(self,outf):
+        """
+        saves the aggregates to npz file outf
+        """
+        state = dict(count=self.count)
+        for key in ('bins','mean','m2','min','max','hist'):
+            if getattr(self,key) is not None:
+                state[key] = getattr(self,key)
+        np.savez(outf,**state)
+
+    @classmethod
+    def load(cls,statf):
+        """
+        loads aggregates saved by RunningStats.save
+        """
+        state = np.load(statf)
+        stats = cls(bins=state['bins'] if 'bins' in state.files else None)
+        stats.count = int(state['count'])
+        for key in ('mean','m2','min','max','hist'):
+            if key in state.files:
+                setattr(stats,key,state[key])
+        return stats
+
+    def __str__(self):
+        if self.count==0:
+            return 'RunningStats(count=0)'
+        fmt = lambda v: '['+', '.join(['%.6g'%vi for vi in v])+']'
+        return 'RunningStats(count=%d, mean=%s, std=%s, min=%s, max=%s)'%(
+            self.count,fmt(self.mean),fmt(self.std),fmt(self.min),fmt(self.max))
+
 @timeit
 def save_tiles_list(img,ul_list,tdim,outdir,outext,savefunc,**kwargs):
+    """
+    save_tiles_list(img,ul_list,tdim,outdir,outext,savefunc,**kwargs)
+    
+    Summary: extracts tiles with upper-left coords in ul_list from img and
+    saves them to outdir/outprefix{row}_{col}{outext} using savefunc. If img
+    is a dict of (name, array) pairs of co-registered arrays (e.g., image, 
+    class mask and validity mask), aligned tiles are extracted in one pass 
+    and saved as paired outputs outdir/outprefix{row}_{col}_{name}{outext},
+    outext and savefunc can then also be dicts keyed by name.
+    
+    Keyword Arguments:
+    - overwrite: remove existing tiles in outdir (default False)
+    - outprefix: output file prefix (default 'tile')
+    - manifest: maintain a per-outdir manifest (MANIFEST_FILE, or a file name
+                relative to outdir) of tile coords, file, content hash and
+                stats; tiles listed in the manifest are skipped without 
+                stat-ing their files. A list of file names reads records
+                from all of them (e.g., a shard manifest and the merged
+                manifest) and writes the first (default False)
+    - dedup: None, 'skip' or 'link': handle tiles whose content hash matches
+             a previously saved tile by skipping them (the manifest points to
+             the existing file) or hardlinking the existing file (default None)
+    - statmask: [nrows x ncols] validity mask, co-extracted with the tiles 
+                for manifest stats and runstats (default None = finite pixels)
+    - statname: name of the array in img used for stats (default first)
+    - bins: histogram bin edges for manifest stats (default None)
+    - runstats: RunningStats updated with the valid pixels of the tiles 
+                extracted in this call (default None)
+    
+    Output:
+    - list of output files (dicts of (name, file) pairs for paired outputs)
+    """
     # ul_list = list of [coord0, ..., coordN] ul coordinates
     if len(ul_list)==0:
         print('empty ul_list: no tiles saved to',outdir)
@@ -201,28 +1186,130 @@ def save_tiles_list(img,ul_list,tdim,outdir,outext,savefunc,**kwargs):
     
     overwrite = kwargs.pop('overwrite',False)
     outprefix = kwargs.pop('outprefix','tile')
+    manifest  = kwargs.pop('manifest',False)
+    dedup     = kwargs.pop('dedup',None)
+    statmask  = kwargs.pop('statmask',None)
+    statname  = kwargs.pop('statname',None)
+    bins      = kwargs.pop('bins',None)
+    runstats  = kwargs.pop('runstats',None)
+    if dedup not in (None,'skip','link'):
+        raise Exception('unknown dedup option "%s"'%str(dedup))
+    
+    arrays = img if isinstance(img,dict) else {None:img}
+    names = list(arrays.keys())
+    if statname is None:
+        statname = names[0]
+    outexts = outext if isinstance(outext,dict) else dict.fromkeys(names,outext)
+    savefuncs = savefunc if isinstance(savefunc,dict) else \
+                dict.fromkeys(names,savefunc)
+    def tilefiles(tul):
+        tilebase = pathjoin(outdir,outprefix+'%d_%d'%tul)
+        return [abspath(tilebase+('' if name is None else '_%s'%name)+
+                        outexts[name]) for name in names]
+
     if pathexists(outdir) and overwrite:
         import glob
-        outregex = outprefix+'*'+outext
-        rmfiles = glob.glob(pathjoin(outdir,outregex))
-        for rmf in rmfiles:
-            os.remove(rmf)
-        msg = 'removed %d existing files '%len(rmfiles)
-        msg += 'matching pattern "%s" in directory %s'%(outregex,outdir)
-        print(msg)
+        for ext in sorted(set(outexts.values())):
+            outregex = outprefix+'*'+ext
+            rmfiles = glob.glob(pathjoin(outdir,outregex))
+            for rmf in rmfiles:
+                os.remove(rmf)
+            msg = 'removed %d existing files '%len(rmfiles)
+            msg += 'matching pattern "%s" in directory %s'%(outregex,outdir)
+            print(msg)
     elif not pathexists(outdir):
         print('created directory %s'%outdir)
         os.makedirs(outdir)
 
-    tiledict = extract_tiles(img,ul_list,tdim)
-    outfiles = []
-    for tul in sorted(tiledict.keys()):
-        timg = tiledict[tul]
-        outf = abspath(pathjoin(outdir,outprefix+'%d_%d'%tul)+outext)
-        savefunc(outf,timg,overwrite=overwrite)
-        outfiles.append(outf)
-    print('Saved',len(outfiles),'tiles to',outdir)
-    return outfiles
+    manifestf = None
+    tilerecs,ownrecs = {},set()
+    if manifest:
+        manifestfs = manifest if isinstance(manifest,list) else [manifest]
+        manifestfs = [pathjoin(outdir,MANIFEST_FILE if mf==True else mf)
+                      for mf in manifestfs]
+        manifestf = manifestfs[0]
+        if overwrite:
+            # read-only manifests describe the tiles removed above
+            for mf in manifestfs[1:]:
+                if pathexists(mf):
+                    os.remove(mf)
+        else:
+            for mf in manifestfs[:0:-1]:
+                tilerecs.update(read_manifest(mf))
+            ownrecs = read_manifest(manifestf)
+            tilerecs.update(ownrecs)
+            ownrecs = set(ownrecs.keys())
+
+    # tiles already listed in the manifest are skipped without stat-ing files
+    # paired outputs are listed as ';'-separated files in the manifest
+    outfiles = {}
+    for tul in ul_list:
+        if tul in tilerecs:
+            outfiles[tul] = [abspath(pathjoin(outdir,outf)) 
+                             for outf in tilerecs[tul]['file'].split(';')]
+    nskip = len(outfiles)
+    
+    hashfiles = dict([(rec['hash'],rec['file']) for rec in tilerecs.values()])
+    todo = sorted(set([tul for tul in ul_list if tul not in outfiles]))
+    stacks = coextract_tiles([arrays[name] for name in names]+
+                             ([] if statmask is None else [statmask]),todo,tdim)
+    valid = None if statmask is None else stacks.pop()[...,0]!=0
+    stacks = dict(zip(names,stacks))
+    # stats for all extracted tiles in one pass over the stack
+    if runstats is not None and len(todo)!=0:
+        runstats.update(stacks[statname],valid)
+    if len(todo)!=0 and (manifestf is not None or dedup is not None):
+        tstats = stats_records(tile_stack_stats(stacks[statname],valid,bins))
+    ndup = 0
+    for k,tul in enumerate(todo):
+        timgs = [stacks[name][k] for name in names]
+        outfs = tilefiles(tul)
+        if manifestf is None and dedup is None:
+            for name,timg,outf in zip(names,timgs,outfs):
+                savefuncs[name](outf,timg,overwrite=overwrite)
+            outfiles[tul] = outfs
+            continue
+
+        if len(timgs)==1:
+            thash = tile_hash(timgs[0])
+        else:
+            thash = tile_hash(np.frombuffer(''.join(map(tile_hash,timgs)).encode(),
+                                            dtype=np.uint8))
+        trec = dict(file=';'.join(map(basename,outfs)),hash=thash)
+        trec.update(tstats[k])
+        srcf = hashfiles.get(thash,None) if dedup else None
+        if srcf is None:
+            for name,timg,outf in zip(names,timgs,outfs):
+                savefuncs[name](outf,timg,overwrite=overwrite)
+            hashfiles[thash] = trec['file']
+        elif dedup=='skip':
+            trec['file'] = srcf
+            outfs = [abspath(pathjoin(outdir,outf)) for outf in srcf.split(';')]
+            ndup += 1
+        else:
+            for outf,linkf in zip(outfs,srcf.split(';')):
+                if pathexists(outf) and not overwrite:
+                    warn('File %s exists, skipping'%outf)
+                    continue
+                if pathexists(outf):
+                    os.remove(outf)
+                os.link(pathjoin(outdir,linkf),outf)
+            ndup += 1
+        tilerecs[tul] = trec
+        ownrecs.add(tul)
+        outfiles[tul] = outfs
+
+    if manifestf is not None:
+        write_manifest(manifestf,dict([(tul,tilerecs[tul]) for tul in ownrecs]))
+    msg = 'Saved %d tiles to %s'%(len(outfiles)-nskip,outdir)
+    if nskip!=0:
+        msg += ' (%d listed in manifest)'%nskip
+    if ndup!=0:
+        msg += ' (%d duplicates %s)'%(ndup,'skipped' if dedup=='skip' else 'linked')
+    print(msg)
+    if names==[None]:
+        return [outfiles[tul][0] for tul in sorted(outfiles.keys())]
+    return [dict(zip(names,outfiles[tul])) for tul in sorted(outfiles.keys())]
 
 # alias for convenience sake
 def save_tiles(img,ul,tdim,outdir,outext,savefunc,**kwargs):
@@ -234,22 +1321,89 @@ def save_tiles(img,ul,tdim,outdir,outext,savefunc,**kwargs):
 
 @timeit
 def plot_tiles(img,ul_list,tdim,**kwargs):
-    import pylab as pl
-    from matplotlib.patches import Rectangle as rect
-    patchkw = dict(edgecolor=kwargs.pop('color','g'),linewidth=1,fill=False)
-    mask = kwargs.pop('mask',np.ones_like(img))
-    show = kwargs.pop('show',True)
-
-    fig,ax = pl.subplots(1,2,sharex=True,sharey=True)
-    ax[0].imshow(img.squeeze())
-    ax[1].imshow(mask.squeeze())
-        
-    for ul in ul_list:
-        ax[0].add_patch(rect(ul[::-1],tdim,tdim,**patchkw))
-        ax[1].add_patch(rect(ul[::-1],tdim,tdim,**patchkw))
+    """
+    plot_tiles(img,ul_list,tdim,**kwargs)
+    
+    Summary: plots tile outlines over img (left) and mask (right), drawing
+    all outlines as a single collection over downsampled previews
+    
+    Arguments:
+    - img: [nrows x ncols x nbands] image
+    - ul_list: list of upper-left tile coords, or dict of (class, list) pairs
+               (e.g., ClassMaskTiler output) to color tiles by class
+    - tdim: tile dimension
+    
+    Keyword Arguments:
+    - mask: [nrows x ncols] mask image (default None = all valid)
+    - color: tile color when ul_list is a list (default 'g')
+    - maxdim: max preview dimension, img and mask are strided so their
+              longest side is at most maxdim pixels (default 2048)
+    - outf: write figure to outf without a GUI backend (default None)
+    - show: call pl.show() (default True if outf is None)
+    - dpi: dpi for outf (default 150)
+    
+    Output:
+    - axes
+    """
+    from matplotlib.collections import PolyCollection
+    color  = kwargs.pop('color','g')
+    mask   = kwargs.pop('mask',None)
+    maxdim = kwargs.pop('maxdim',2048)
+    outf   = kwargs.pop('outf',None)
+    show   = kwargs.pop('show',outf is None)
+    dpi    = kwargs.pop('dpi',150)
 
+    if show:
+        import pylab as pl
+        fig,ax = pl.subplots(1,2,sharex=True,sharey=True)
+    else:
+        # headless rendering, no pylab/GUI backend required
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.subplots(1,2,sharex=True,sharey=True)
+
+    # strided previews, extent keeps full-resolution pixel coordinates
+    nrows,ncols = img.shape[0],img.shape[1]
+    step = max(1,int(np.ceil(max(nrows,ncols)/float(maxdim))))
+    extent = (-0.5,ncols-0.5,nrows-0.5,-0.5)
+    imgprev = np.asarray(img[::step,::step])
+    if mask is None:
+        maskprev = np.ones(imgprev.shape[:2],dtype=np.uint8)
+    else:
+        maskprev = np.asarray(mask[::step,::step])
+    ax[0].imshow(imgprev.squeeze(),extent=extent)
+    ax[1].imshow(maskprev.squeeze(),extent=extent)
+
+    if isinstance(ul_list,dict):
+        groups = [(key,ul_list[key],'C%d'%(k%10))
+                  for k,key in enumerate(sorted(ul_list.keys()))]
+    else:
+        groups = [(None,ul_list,color)]
+
+    # tile outline vertices in (x,y) = (col,row) order
+    offsets = np.float64([[0,0],[tdim,0],[tdim,tdim],[0,tdim]])
+    verts,colors = [],[]
+    for key,ul,tcolor in groups:
+        ul = np.float64(ul).reshape([-1,2])
+        verts.append(ul[:,None,::-1]+offsets[None])
+        colors.extend([tcolor]*len(ul))
+    verts = np.concatenate(verts,axis=0) if verts else np.zeros([0,4,2])
+    
+    for axi in ax:
+        axi.add_collection(PolyCollection(verts,facecolors='none',
+                                          edgecolors=colors,linewidths=1))
+
+    if len(groups) > 1:
+        from matplotlib.lines import Line2D
+        handles = [Line2D([],[],color=tcolor,label='%s (%d)'%(key,len(ul)))
+                   for key,ul,tcolor in groups]
+        ax[0].legend(handles=handles,loc='best')
+
+    if outf is not None:
+        fig.savefig(outf,dpi=dpi)
     if show:
         pl.show()
             
     return ax
-
@@ -0,0 +1,125 @@
+from __future__ import absolute_import, print_function, division
+
+from .util import *
+from .basetiler import *
+from numpy.random import rand
+
+class WeightedTiler(SamplingTiler):
+    """
+    WeightedTiler(weights,tiledim,**kwargs)
+
+    Summary: samples tiles with probability proportional to the sum of a
+    per-pixel weight map over each tile footprint. Weights are pooled to
+    upper-left positions with a box sum and tiles are drawn by binary search
+    over the cumulative distribution, O(log n) per draw.
+
+    Arguments:
+    - weights: [nrows x ncols] nonnegative per-pixel weight map (bool masks
+               are treated as 0/1 weights)
+    - tiledim: tile dimension
+
+    Keyword Arguments:
+    - numtiles: number of tiles to sample
+    - mask: [nrows x ncols] bool mask of valid pixels (default None)
+    - mincover: min fraction of valid mask pixels per tile (default 0.0,
+                1.0 = tile footprint entirely within mask)
+    - minsep: min row/col distance between upper-left coords of selected
+              tiles (default 0 = no overlap suppression, tiledim = no overlap)
+    - maxsearch: max number of draws per tile (default 1000)
+
+    Output:
+    None
+    """
+    def __init__(self,weights,tiledim,**kwargs):
+        super(WeightedTiler,self).__init__(tiledim,**kwargs)
+        self.numtiles    = kwargs.pop('numtiles',MIN_TILES)
+        self.mincover    = kwargs.pop('mincover',0.0)
+        self.minsep      = int(kwargs.pop('minsep',0))
+        self.maxsearch   = kwargs.pop('maxsearch',1000)
+        mask             = kwargs.pop('mask',None)
+
+        nrows,ncols = weights.shape[0],weights.shape[1]
+        if nrows<tiledim or ncols<tiledim:
+            msg='tiledim %d too large for shape (%d x %d)'%(tiledim,nrows,ncols)
+            raise Exception(msg)
+
+        self.nrows    = nrows
+        self.ncols    = ncols
+        self.ntilepix = tiledim*tiledim
+
+        weights = np.float64(weights)
+        if (weights<0).any():
+            raise Exception('weights must be nonnegative')
+        if mask is not None:
+            weights = weights*(mask!=0)
+
+        # pool weights to upper-left positions, zero those below mincover
+        self.ulweights = np.clip(boxsum(weights,tiledim),0,None)
+        if mask is not None and self.mincover > 0:
+            mincount = int(np.ceil(self.mincover*self.ntilepix))
+            self.ulweights[boxsum(mask!=0,tiledim)<mincount] = 0
+        self.ulweights[self.exclude.tomask(self.ulweights.shape)!=0] = 0
+        self.nulcols = self.ulweights.shape[1]
+        self.cdf = np.cumsum(self.ulweights.ravel())
+        if self.cdf[-1] <= 0:
+            warn('all tile weights zero, cannot generate tiles')
+
+        self.tiles   = []
+        self.visited = set([])
+        self.buckets = {}
+
+    def _overlaps(self,ij):
+        # check selected tiles in neighboring minsep x minsep buckets
+        bi,bj = ij[0]//self.minsep,ij[1]//self.minsep
+        for di in (-1,0,1):
+            for dj in (-1,0,1):
+                for i,j in self.buckets.get((bi+di,bj+dj),[]):
+                    if abs(i-ij[0])<self.minsep and abs(j-ij[1])<self.minsep:
+                        return True
+        return False
+
+    def _select(self,ij):
+        self.visited.add(ij)
+        if self.minsep > 0:
+            bij = (ij[0]//self.minsep,ij[1]//self.minsep)
+            self.buckets.setdefault(bij,[]).append(ij)
+
+    def next(self):
+        # draws upper-left positions from the cdf until one is acceptable
+        total = self.cdf[-1]
+        if total <= 0:
+            return None
+        for isearch in range(self.maxsearch):
+            idx = int(np.searchsorted(self.cdf,rand()*total,side='right'))
+            ij = (idx//self.nulcols,idx%self.nulcols)
+            if ij in self.visited:
+                continue
+            if self.minsep > 0 and self._overlaps(ij):
+                continue
+            self._select(ij)
+            return (slice(ij[0],ij[0]+self.tiledim,None),
+                    slice(ij[1],ij[1]+self.tiledim,None))
+        return None
+
+    def get_state(self):
+        state = super(WeightedTiler,self).get_state()
+        state.update(visited=coords2array(self.visited),
+                     shape=np.int64([self.nrows,self.ncols]))
+        return state
+
+    def set_state(self,state):
+        if tuple(state['shape']) != (self.nrows,self.ncols):
+            msg = 'checkpoint weights shape %s != weights shape %s'
+            raise Exception(msg%(str(tuple(state['shape'])),
+                                 str((self.nrows,self.ncols))))
+        super(WeightedTiler,self).set_state(state)
+        self.visited = set([])
+        self.buckets = {}
+        for ij in array2coords(state['visited']):
+            self._select(ij)
+
+    @timeit
+    def collect(self):
+        if self.ul != []:
+            return self.ul
+        return self.extend(self.numtiles)